@@ -4,13 +4,19 @@ setup(
     name="llm-test-tool",
     version="0.1.2",
     packages=find_packages(),
+    python_requires=">=3.10",
     install_requires=[
         "streamlit",
         "python-dotenv",
         "openai",
+        "httpx",
         "anthropic",
         "google-cloud-aiplatform",
         "pandas",
         "plotly",
+        "orjson",
+        "tenacity",
+        "tiktoken",
+        'uvloop>=0.18; platform_system != "Windows"',
     ],
 ) 
\ No newline at end of file
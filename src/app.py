@@ -2,6 +2,7 @@ import os
 import asyncio
 import streamlit as st
 from dotenv import load_dotenv
+from services import LLMServiceFactory
 from pages.home.home_page import home_page
 from pages.chat.chat_page import chat_page
 from pages.stats.stats_page import stats_page
@@ -43,10 +44,20 @@ async def main():
     page = st.sidebar.selectbox("导航", list(pages.keys()))
     
     # 根据选择显示页面
-    if page == "对话":
-        await pages[page]()
-    else:
-        pages[page]()
+    try:
+        if asyncio.iscoroutinefunction(pages[page]):
+            await pages[page]()
+        else:
+            pages[page]()
+    finally:
+        # 服务实例的客户端连接池绑定当前事件循环，在 asyncio.run 关闭事件循环前释放
+        await LLMServiceFactory.aclose()
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    # 使用 uvloop 加速事件循环（Windows 不支持）
+    try:
+        import uvloop
+    except ImportError:
+        asyncio.run(main())
+    else:
+        uvloop.run(main()) 
\ No newline at end of file
@@ -1,5 +1,5 @@
 import streamlit as st
-from typing import List, Optional
+from typing import Optional
 import time
 from ..services import Message, LLMServiceFactory
 
@@ -17,13 +17,19 @@ def display_message(message: Message, is_user: bool = False):
     with st.chat_message("user" if is_user else "assistant"):
         st.markdown(message.content)
 
-def display_chat_history():
-    """显示聊天历史"""
-    for message in st.session_state.messages:
-        display_message(
-            message,
-            is_user=(message.role == "user")
-        )
+def display_chat_history(max_messages: Optional[int] = None):
+    """显示聊天历史
+    
+    Args:
+        max_messages: 最多显示的最近消息数，默认显示全部
+    """
+    messages = st.session_state.messages
+    if max_messages is not None:
+        messages = messages[-max_messages:]
+    
+    for role, content in ((m.role, m.content) for m in messages):
+        with st.chat_message(role):
+            st.markdown(content)
 
 async def process_message(
     provider: str,
@@ -59,7 +65,7 @@ async def process_message(
             message_placeholder.markdown("🤔 思考中...")
             
             # 记录开始时间
-            start_time = time.time()
+            start_time = time.perf_counter()
             
             # 调用API
             response = await service.chat_complete(
@@ -69,7 +75,7 @@ async def process_message(
             )
             
             # 计算响应时间
-            response_time = time.time() - start_time
+            response_time = time.perf_counter() - start_time
             
             # 更新显示
             message_placeholder.markdown(response.text)
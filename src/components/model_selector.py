@@ -1,6 +1,20 @@
 import streamlit as st
 from typing import Tuple
 from services import LLMServiceFactory
+from components.service_cache import cached_models
+
+# 服务提供商显示名称
+PROVIDER_DISPLAY = {
+    "openai": "OpenAI",
+    "azure-openai": "Azure OpenAI",
+    "anthropic": "Anthropic",
+    "google": "Google",
+    "huggingface": "Hugging Face"
+}
+
+def format_model(model: str) -> str:
+    """模型显示名称"""
+    return model.split("/")[-1] if "/" in model else model
 
 async def model_selector() -> Tuple[str, str]:
     """模型选择器组件
@@ -18,25 +32,19 @@ async def model_selector() -> Tuple[str, str]:
         provider = st.selectbox(
             "选择服务提供商",
             options=providers,
-            format_func=lambda x: {
-                "openai": "OpenAI",
-                "azure-openai": "Azure OpenAI",
-                "anthropic": "Anthropic",
-                "google": "Google",
-                "huggingface": "Hugging Face"
-            }.get(x, x.title())
+            format_func=lambda x: PROVIDER_DISPLAY.get(x, x.title())
         )
     
     # 获取选中服务商的可用模型
     if provider:
-        service = LLMServiceFactory.get_service(provider)
-        models = await service.get_available_models()
+        models = await cached_models(provider)
+        display_names = {m: format_model(m) for m in models}
         
         with col2:
             model = st.selectbox(
                 "选择模型",
                 options=models,
-                format_func=lambda x: x.split("/")[-1] if "/" in x else x
+                format_func=display_names.__getitem__
             )
     else:
         model = None
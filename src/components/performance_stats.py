@@ -1,16 +1,168 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 
-def display_response_time_chart(data: List[Dict]):
-    """显示响应时间图表"""
-    if not data:
-        return
+# 性能记录的列名，记录按列存储在 st.session_state.performance_records 中
+PERF_COLUMNS = (
+    "timestamp",
+    "provider",
+    "model",
+    "response_time",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "cost"
+)
+
+# 每个图表缓存函数保留的最大条目数，缓存键随记录追加而变化，需要限制缓存占用的内存
+FIGURE_CACHE_ENTRIES = 16
+
+def records_frame(records: Dict[str, List]) -> pd.DataFrame:
+    """构建按列存储的性能记录的DataFrame
+    
+    DataFrame 保存在当前会话的 session state 中，不经 st.cache_data 序列化，也不在会话间累积。
+    记录只会追加，记录数和最后一条记录的时间戳不变时直接复用。
+    
+    Args:
+        records: 按列存储的性能记录
+    
+    Returns:
+        pd.DataFrame: 性能记录
+    """
+    timestamps = records["timestamp"]
+    key = (id(records), len(timestamps), timestamps[-1] if timestamps else None)
+    cached = st.session_state.get("_perf_frame")
+    if cached is None or cached[0] != key:
+        cached = st.session_state._perf_frame = (key, pd.DataFrame(records))
+    return cached[1]
+
+def new_performance_records() -> Dict[str, List]:
+    """创建按列存储的空性能记录"""
+    return {column: [] for column in PERF_COLUMNS}
+
+def _update_perf_stats(
+    perf_stats: Dict[tuple, Dict],
+    provider: str,
+    model: str,
+    response_time: float,
+    prompt_tokens: int,
+    completion_tokens: int,
+    cost: float
+):
+    """增量更新按 (服务提供商, 模型) 分组的统计量
+    
+    响应时间的均值和方差使用 Welford 算法更新，每条记录 O(1)。
+    """
+    stats = perf_stats.get((provider, model))
+    if stats is None:
+        stats = perf_stats[(provider, model)] = {
+            "count": 0,
+            "mean_rt": 0.0,
+            "m2_rt": 0.0,
+            "min_rt": response_time,
+            "max_rt": response_time,
+            "sum_prompt": 0,
+            "sum_completion": 0,
+            "sum_cost": 0.0
+        }
     
-    df = pd.DataFrame(data)
-    fig = px.box(
+    stats["count"] += 1
+    delta = response_time - stats["mean_rt"]
+    stats["mean_rt"] += delta / stats["count"]
+    stats["m2_rt"] += delta * (response_time - stats["mean_rt"])
+    stats["min_rt"] = min(stats["min_rt"], response_time)
+    stats["max_rt"] = max(stats["max_rt"], response_time)
+    stats["sum_prompt"] += prompt_tokens
+    stats["sum_completion"] += completion_tokens
+    stats["sum_cost"] += cost
+
+def _perf_stats_for(records: Dict[str, List]) -> Dict[tuple, Dict]:
+    """由性能记录得出按 (服务提供商, 模型) 分组的统计量
+    
+    session state 中保存已统计的记录数，每次只处理新追加的记录；
+    记录被替换（如清空后重建）时重新统计。
+    
+    Args:
+        records: 按列存储的性能记录
+    
+    Returns:
+        Dict[tuple, Dict]: 按 (服务提供商, 模型) 分组的统计量
+    """
+    count = len(records["timestamp"])
+    state = st.session_state.get("_perf_stats_state")
+    if state is None or state["records"] is not records or state["count"] > count:
+        state = st.session_state._perf_stats_state = {"records": records, "count": 0, "stats": {}}
+    
+    perf_stats = state["stats"]
+    for i in range(state["count"], count):
+        _update_perf_stats(
+            perf_stats,
+            records["provider"][i],
+            records["model"][i],
+            records["response_time"][i],
+            records["prompt_tokens"][i],
+            records["completion_tokens"][i],
+            records["cost"][i]
+        )
+    state["count"] = count
+    return perf_stats
+
+def _build_stats_frames(perf_stats: Dict[tuple, Dict]) -> Dict[str, pd.DataFrame]:
+    """由增量统计量构建各项统计表，无需对全部记录执行 groupby
+    
+    Args:
+        perf_stats: 按 (服务提供商, 模型) 分组的统计量
+    
+    Returns:
+        Dict[str, pd.DataFrame]: 响应时间、Token使用量和成本统计
+    """
+    index = pd.MultiIndex.from_tuples(
+        sorted(perf_stats.keys()),
+        names=["provider", "model"]
+    )
+    rows = [perf_stats[key] for key in index]
+    counts = [row["count"] for row in rows]
+    total_tokens = [row["sum_prompt"] + row["sum_completion"] for row in rows]
+    
+    rt_stats = pd.DataFrame({
+        "count": counts,
+        "mean": [row["mean_rt"] for row in rows],
+        # 与 pandas 的 std 保持一致（ddof=1），单条记录时为空
+        "std": [
+            (row["m2_rt"] / (row["count"] - 1)) ** 0.5 if row["count"] > 1 else float("nan")
+            for row in rows
+        ],
+        "min": [row["min_rt"] for row in rows],
+        "max": [row["max_rt"] for row in rows]
+    }, index=index).round(3)
+    
+    token_stats = pd.DataFrame({
+        ("prompt_tokens", "sum"): [row["sum_prompt"] for row in rows],
+        ("prompt_tokens", "mean"): [row["sum_prompt"] / row["count"] for row in rows],
+        ("completion_tokens", "sum"): [row["sum_completion"] for row in rows],
+        ("completion_tokens", "mean"): [row["sum_completion"] / row["count"] for row in rows],
+        ("total_tokens", "sum"): total_tokens,
+        ("total_tokens", "mean"): [t / c for t, c in zip(total_tokens, counts)]
+    }, index=index).round(2)
+    
+    cost_stats = pd.DataFrame({
+        ("cost", "sum"): [row["sum_cost"] for row in rows],
+        ("cost", "mean"): [row["sum_cost"] / row["count"] for row in rows],
+        ("cost", "count"): counts
+    }, index=index).round(4)
+    
+    return {
+        "rt_stats": rt_stats,
+        "token_stats": token_stats,
+        "cost_stats": cost_stats
+    }
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _response_time_figure(df: pd.DataFrame):
+    """构建响应时间图表"""
+    return px.box(
         df,
         x="model",
         y="response_time",
@@ -22,15 +174,11 @@ def display_response_time_chart(data: List[Dict]):
             "provider": "服务提供商"
         }
     )
-    st.plotly_chart(fig, use_container_width=True)
 
-def display_token_usage_chart(data: List[Dict]):
-    """显示Token使用量图表"""
-    if not data:
-        return
-    
-    df = pd.DataFrame(data)
-    fig = px.bar(
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _token_usage_figure(df: pd.DataFrame):
+    """构建Token使用量图表"""
+    return px.bar(
         df,
         x="model",
         y=["prompt_tokens", "completion_tokens"],
@@ -44,14 +192,42 @@ def display_token_usage_chart(data: List[Dict]):
             "variable": "Token类型"
         }
     )
-    st.plotly_chart(fig, use_container_width=True)
 
-def display_cost_analysis(data: List[Dict]):
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _cost_trend_figure(df: pd.DataFrame):
+    """构建成本趋势图表"""
+    return px.line(
+        df,
+        x="timestamp",
+        y="cost",
+        color="provider",
+        title="成本趋势",
+        labels={
+            "timestamp": "时间",
+            "cost": "成本 (USD)",
+            "provider": "服务提供商"
+        }
+    )
+
+def display_response_time_chart(df: pd.DataFrame):
+    """显示响应时间图表"""
+    if df.empty:
+        return
+    
+    st.plotly_chart(_response_time_figure(df), use_container_width=True)
+
+def display_token_usage_chart(df: pd.DataFrame):
+    """显示Token使用量图表"""
+    if df.empty:
+        return
+    
+    st.plotly_chart(_token_usage_figure(df), use_container_width=True)
+
+def display_cost_analysis(df: pd.DataFrame):
     """显示成本分析"""
-    if not data:
+    if df.empty:
         return
     
-    df = pd.DataFrame(data)
     total_cost = df["cost"].sum()
     avg_cost = df["cost"].mean()
     
@@ -70,26 +246,24 @@ def display_cost_analysis(data: List[Dict]):
         )
     
     # 成本趋势图
-    fig = px.line(
-        df,
-        x="timestamp",
-        y="cost",
-        color="provider",
-        title="成本趋势",
-        labels={
-            "timestamp": "时间",
-            "cost": "成本 (USD)",
-            "provider": "服务提供商"
-        }
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(_cost_trend_figure(df), use_container_width=True)
 
-def performance_dashboard(data: List[Dict]):
-    """性能统计仪表板"""
-    if not data:
+def performance_dashboard(data: Optional[Dict[str, List]] = None):
+    """性能统计仪表板
+    
+    Args:
+        data: 按列存储的性能记录，默认使用 st.session_state.performance_records。
+            图表和统计表均由 data 得出。
+    """
+    if data is None:
+        data = st.session_state.get("performance_records")
+    if not data or not data["timestamp"]:
         st.info("暂无性能数据")
         return
     
+    df = records_frame(data)
+    frames = _build_stats_frames(_perf_stats_for(data))
+    
     # 创建选项卡
     tab1, tab2, tab3 = st.tabs([
         "响应时间分析",
@@ -98,40 +272,22 @@ def performance_dashboard(data: List[Dict]):
     ])
     
     with tab1:
-        display_response_time_chart(data)
+        display_response_time_chart(df)
         
         # 显示详细统计
-        df = pd.DataFrame(data)
-        st.dataframe(
-            df.groupby(["provider", "model"])["response_time"].agg([
-                "count",
-                "mean",
-                "std",
-                "min",
-                "max"
-            ]).round(3),
-            use_container_width=True
-        )
+        st.dataframe(frames["rt_stats"], use_container_width=True)
     
     with tab2:
-        display_token_usage_chart(data)
+        display_token_usage_chart(df)
         
         # Token使用量统计
-        token_stats = df.groupby(["provider", "model"]).agg({
-            "prompt_tokens": ["sum", "mean"],
-            "completion_tokens": ["sum", "mean"],
-            "total_tokens": ["sum", "mean"]
-        }).round(2)
-        st.dataframe(token_stats, use_container_width=True)
+        st.dataframe(frames["token_stats"], use_container_width=True)
     
     with tab3:
-        display_cost_analysis(data)
+        display_cost_analysis(df)
         
         # 成本明细
-        cost_details = df.groupby(["provider", "model"]).agg({
-            "cost": ["sum", "mean", "count"]
-        }).round(4)
-        st.dataframe(cost_details, use_container_width=True)
+        st.dataframe(frames["cost_stats"], use_container_width=True)
 
 def add_performance_record(
     provider: str,
@@ -152,17 +308,14 @@ def add_performance_record(
         cost: 成本（美元）
     """
     if "performance_records" not in st.session_state:
-        st.session_state.performance_records = []
-    
-    record = {
-        "timestamp": datetime.now(),
-        "provider": provider,
-        "model": model,
-        "response_time": response_time,
-        "prompt_tokens": prompt_tokens,
-        "completion_tokens": completion_tokens,
-        "total_tokens": prompt_tokens + completion_tokens,
-        "cost": cost
-    }
+        st.session_state.performance_records = new_performance_records()
     
-    st.session_state.performance_records.append(record) 
\ No newline at end of file
+    records = st.session_state.performance_records
+    records["timestamp"].append(datetime.now())
+    records["provider"].append(provider)
+    records["model"].append(model)
+    records["response_time"].append(response_time)
+    records["prompt_tokens"].append(prompt_tokens)
+    records["completion_tokens"].append(completion_tokens)
+    records["total_tokens"].append(prompt_tokens + completion_tokens)
+    records["cost"].append(cost)
@@ -0,0 +1,48 @@
+import time
+import streamlit as st
+from services import LLMServiceFactory
+
+# 模型列表缓存时间（秒）
+MODELS_CACHE_TTL = 300
+
+# 模型信息缓存时间（秒）
+MODEL_INFO_CACHE_TTL = 3600
+
+async def _session_cached(cache_name: str, key, ttl: float, fetch):
+    """在 session state 中按键缓存协程结果
+    
+    协程结果无法交给 st.cache_data 缓存，这里在 session state 中缓存
+    
+    Args:
+        cache_name: session state 中的缓存名称
+        key: 缓存键
+        ttl: 缓存时间（秒）
+        fetch: 未命中时调用的无参协程函数
+    """
+    cache = st.session_state.setdefault(cache_name, {})
+    entry = cache.get(key)
+    now = time.monotonic()
+    if entry and now - entry[0] < ttl:
+        return entry[1]
+    
+    value = await fetch()
+    cache[key] = (now, value)
+    return value
+
+async def cached_models(provider: str) -> list:
+    """获取缓存的模型列表"""
+    return await _session_cached(
+        "_models_cache",
+        provider,
+        MODELS_CACHE_TTL,
+        lambda: LLMServiceFactory.get_service(provider).get_available_models()
+    )
+
+async def cached_model_info(provider: str, model: str):
+    """获取缓存的模型信息（含定价）"""
+    return await _session_cached(
+        "_model_info_cache",
+        (provider, model),
+        MODEL_INFO_CACHE_TTL,
+        lambda: LLMServiceFactory.get_service(provider).get_model_info(model)
+    )
@@ -0,0 +1,7 @@
+"""
+对话页面
+"""
+
+from .chat_page import chat_page
+
+__all__ = ['chat_page']
@@ -1,77 +1,171 @@
 import os
+import time
+import uuid
 import streamlit as st
 import asyncio
-from components.model_selector import model_selector, model_parameters
 from services import LLMServiceFactory
-from services.base import Message
-from services.openai_service import OpenAIService
-from services.azure_openai_service import AzureOpenAIService
-from services.anthropic_service import AnthropicService
+from services.azure_openai_service import _AZURE_ENV_PATHS, _parse_azure_configs
+from components.service_cache import cached_models, cached_model_info
+from components.performance_stats import add_performance_record, new_performance_records
+
+# 服务提供商显示名称
+PROVIDER_DISPLAY = {
+    "openai": "OpenAI",
+    "azure-openai": "Azure OpenAI",
+    "anthropic": "Anthropic",
+    "google": "Google"
+}
+
+# 内存中保留的最近消息数，更早的消息写入磁盘，同时作为发送给模型的上下文长度
+MAX_IN_MEMORY = 20
+
+# 聊天记录文件目录
+CHAT_HISTORY_DIR = os.path.join(os.getenv("DATA_DIR", "./data"), "chat_history")
+
+# 超过该时间（秒）未写入的聊天记录文件视为已结束会话的记录，新会话开始时删除
+CHAT_HISTORY_TTL = 24 * 3600
+
+# 流式输出时刷新界面的时间间隔（秒，即最高 20Hz）和累积字符数，满足其一即刷新
+STREAM_FLUSH_INTERVAL = 0.05
+STREAM_FLUSH_CHARS = 64
 
 def check_service_config(service_name: str) -> bool:
     """检查服务配置是否完整"""
     if service_name == "OpenAI":
         return bool(os.getenv("OPENAI_API_KEY"))
     elif service_name == "Azure OpenAI":
-        # 检查是否有任何Azure OpenAI配置组
-        # 首先尝试加载指定路径的配置文件
-        env_paths = [
-            "/mount/src/check-llm/.env",  # 线上环境路径
-            os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')  # 本地环境路径
-        ]
-        
-        for env_path in env_paths:
+        # 与服务使用同一解析结果：第一个存在的配置文件中是否有完整的配置组
+        for env_path in _AZURE_ENV_PATHS:
             if os.path.exists(env_path):
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    current_group = None
-                    has_valid_config = False
-                    current_config = {}
-                    
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        if line.startswith('## '):
-                            # 检查上一个配置组是否有效
-                            if current_config and all(key in current_config for key in [
-                                'AZURE_OPENAI_API_KEY',
-                                'AZURE_OPENAI_ENDPOINT',
-                                'AZURE_DEPLOYMENT_NAME'
-                            ]):
-                                has_valid_config = True
-                                break
-                            current_group = line[3:].strip()
-                            current_config = {}
-                            continue
-                        if line.startswith('#'):
-                            continue
-                        if '=' in line and current_group:
-                            key, value = line.split('=', 1)
-                            key = key.strip()
-                            value = value.strip()
-                            if key.startswith('AZURE_') and value and value not in [
-                                'your_azure_openai_api_key',
-                                'your_aws_api_key',
-                                'your_google_api_key'
-                            ]:
-                                current_config[key] = value
-                    
-                    # 检查最后一个配置组
-                    if current_config and all(key in current_config for key in [
-                        'AZURE_OPENAI_API_KEY',
-                        'AZURE_OPENAI_ENDPOINT',
-                        'AZURE_DEPLOYMENT_NAME'
-                    ]):
-                        has_valid_config = True
-                    
-                    if has_valid_config:
-                        return True
+                return bool(_parse_azure_configs(env_path, os.path.getmtime(env_path)))
         
         return False
     elif service_name == "Anthropic":
         return bool(os.getenv("ANTHROPIC_API_KEY"))
     return False
 
+def _env_signature() -> tuple:
+    """服务配置相关环境的签名，任一配置变化时签名随之变化"""
+    return (
+        bool(os.getenv("OPENAI_API_KEY")),
+        bool(os.getenv("ANTHROPIC_API_KEY")),
+        tuple(
+            os.path.getmtime(env_path) if os.path.exists(env_path) else None
+            for env_path in _AZURE_ENV_PATHS
+        )
+    )
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _available_providers_cached(env_signature: tuple) -> dict:
+    """获取已配置的服务提供商
+
+    env_signature 仅作为缓存键使用，见 _env_signature
+    """
+    return {
+        key: name for key, name in PROVIDER_DISPLAY.items()
+        if check_service_config(name)
+    }
+
+def _prune_stale_history():
+    """删除超过 CHAT_HISTORY_TTL 未写入的聊天记录文件"""
+    try:
+        entries = os.scandir(CHAT_HISTORY_DIR)
+    except FileNotFoundError:
+        return
+    
+    cutoff = time.time() - CHAT_HISTORY_TTL
+    with entries:
+        for entry in entries:
+            if not (entry.name.startswith(".chat_") and entry.name.endswith(".jsonl")):
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                # 其他会话同时清理了该文件
+                pass
+
+def _chat_history_path() -> str:
+    """当前会话的聊天记录文件路径，会话首次使用时清理过期的聊天记录文件"""
+    session_id = st.session_state.get("_chat_session_id")
+    if session_id is None:
+        session_id = st.session_state._chat_session_id = uuid.uuid4().hex
+        _prune_stale_history()
+    return os.path.join(CHAT_HISTORY_DIR, f".chat_{session_id}.jsonl")
+
+def _spill_old_messages():
+    """将超出 MAX_IN_MEMORY 的旧消息追加写入当前会话的聊天记录文件
+    
+    同时在 session state 中记录每条消息在文件中的起始位置，读取时只需定位到所需的部分
+    """
+    messages = st.session_state.messages
+    overflow = len(messages) - MAX_IN_MEMORY
+    if overflow <= 0:
+        return
+    
+    import json
+    
+    offsets = st.session_state.setdefault("_chat_history_offsets", [])
+    os.makedirs(CHAT_HISTORY_DIR, exist_ok=True)
+    with open(_chat_history_path(), 'ab') as f:
+        for message in messages[:overflow]:
+            offsets.append(f.tell())
+            f.write((json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8'))
+    del messages[:overflow]
+
+def _load_older_messages(count: int) -> list:
+    """读取已写入磁盘的最近 count 条消息
+    
+    按记录的起始位置只读取文件末尾的 count 条，结果缓存在 session state 中，
+    显示条数和文件内容不变时不再读取
+    """
+    offsets = st.session_state.get("_chat_history_offsets", [])
+    count = min(count, len(offsets))
+    if count <= 0:
+        return []
+    
+    key = (count, len(offsets))
+    cached = st.session_state.get("_older_messages")
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    
+    import json
+    
+    try:
+        with open(_chat_history_path(), 'rb') as f:
+            f.seek(offsets[-count])
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        # 文件已被清理，丢弃失效的索引
+        _clear_chat_history()
+        return []
+    
+    messages = [json.loads(line) for line in lines]
+    st.session_state._older_messages = (key, messages)
+    return messages
+
+def _clear_chat_history():
+    """删除当前会话的聊天记录文件及其索引"""
+    path = _chat_history_path()
+    if os.path.exists(path):
+        os.remove(path)
+    st.session_state.pop("_chat_history_offsets", None)
+    st.session_state.pop("_older_messages", None)
+    st.session_state.older_messages_shown = 0
+
+def _render_bubble(role: str, content: str):
+    """显示一条聊天消息"""
+    with st.chat_message(role):
+        st.markdown(content)
+
+async def _content_only(response_generator, stats: dict):
+    """只输出流式响应中的文本片段，最终的统计信息写入 stats"""
+    async for chunk in response_generator:
+        if chunk["type"] == "content":
+            yield chunk["content"]
+        elif chunk["type"] == "stats":
+            stats.update(chunk["stats"])
+
 async def get_service_provider():
     """获取服务提供商"""
     # 初始化session state
@@ -80,18 +174,8 @@ async def get_service_provider():
     if 'model' not in st.session_state:
         st.session_state.model = None
     
-    providers = {
-        "openai": "OpenAI",
-        "azure-openai": "Azure OpenAI",
-        "anthropic": "Anthropic",
-        "google": "Google"
-    }
-    
     # 获取已配置的服务提供商
-    available_providers = {
-        key: name for key, name in providers.items()
-        if check_service_config(name)
-    }
+    available_providers = _available_providers_cached(_env_signature())
     
     if not available_providers:
         st.error("未找到任何可用的服务提供商，请先在配置管理页面设置相关API密钥")
@@ -101,7 +185,7 @@ async def get_service_provider():
     provider = st.selectbox(
         "选择服务提供商",
         options=list(available_providers.keys()),
-        format_func=lambda x: available_providers[x]
+        format_func=available_providers.__getitem__
     )
     
     if not provider:
@@ -109,25 +193,142 @@ async def get_service_provider():
     
     # 实例化服务
     try:
-        service = LLMServiceFactory.get_service(provider)
-        models = await service.get_available_models()
+        models = await cached_models(provider)
         
         if not models:
-            st.error(f"{providers[provider]} 未获取到可用模型，请检查配置是否正确")
+            st.error(f"{PROVIDER_DISPLAY[provider]} 未获取到可用模型，请检查配置是否正确")
             return None, None
         
+        display_names = {
+            m: m.split(" - ")[-1] if " - " in m else m
+            for m in models
+        }
         model = st.selectbox(
             "选择模型",
             options=models,
-            format_func=lambda x: x.split(" - ")[-1] if " - " in x else x
+            format_func=display_names.__getitem__
         )
         
         return provider, model
         
     except Exception as e:
-        st.error(f"初始化 {providers[provider]} 服务失败: {str(e)}")
+        st.error(f"初始化 {PROVIDER_DISPLAY[provider]} 服务失败: {str(e)}")
         return None, None
 
+async def _chat_turn(provider: str, model: str):
+    """处理一轮对话：读取用户输入并流式显示模型响应"""
+    prompt = st.chat_input()
+    if not prompt:
+        return
+    
+    # 添加用户消息
+    st.session_state.messages.append({
+        "role": "user",
+        "content": prompt
+    })
+    
+    _render_bubble("user", prompt)
+    
+    # 调用API
+    with st.chat_message("assistant"):
+        message_placeholder = st.empty()
+        stats_placeholder = st.empty()
+        parts: list[str] = []
+        full_response = ""
+        
+        # 与生成过程并行获取模型信息，供计算成本时使用
+        model_info_task = asyncio.create_task(cached_model_info(provider, model))
+        
+        try:
+            message_placeholder.markdown("🤔 思考中...")
+            
+            # 获取流式响应
+            # session state 中的消息已是接口所需的 {"role", "content"} 格式，直接传入
+            response_generator = await LLMServiceFactory.get_service(provider).chat_completion(
+                messages=st.session_state.messages,
+                model=model,
+                stream=True
+            )
+            
+            # 处理流式响应，按时间间隔或累积字符数批量刷新界面
+            stats = {}
+            last_flush = time.monotonic()
+            flushed = 0  # 已拼接到 full_response 的片段数
+            pending = 0
+            async for content in _content_only(response_generator, stats):
+                parts.append(content)
+                pending += len(content)
+                now = time.monotonic()
+                if now - last_flush >= STREAM_FLUSH_INTERVAL or pending >= STREAM_FLUSH_CHARS:
+                    # 只拼接上次刷新后新增的片段
+                    full_response += "".join(parts[flushed:])
+                    flushed = len(parts)
+                    message_placeholder.markdown(full_response + "▌")
+                    last_flush = now
+                    pending = 0
+            
+            # 检查是否有响应
+            full_response = "".join(parts)
+            if not full_response:
+                message_placeholder.error("模型没有生成任何响应")
+                if st.session_state.messages:
+                    st.session_state.messages.pop()  # 移除用户消息
+                return
+            
+            # 显示最终响应（不带光标）
+            message_placeholder.markdown(full_response)
+            
+            if stats:
+                # 添加助手消息到历史记录
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": full_response
+                })
+                _spill_old_messages()
+                
+                # 缺少定价时不计算成本
+                model_info = await model_info_task
+                if model_info and model_info.pricing:
+                    # 计算成本（pricing 为每1k tokens的价格）
+                    total_cost = (
+                        model_info.pricing["input"] * 1e-3 * stats["prompt_tokens"] +
+                        model_info.pricing["output"] * 1e-3 * stats["completion_tokens"]
+                    )
+                    
+                    # 显示统计信息
+                    stats_placeholder.caption(
+                        f"响应时间: {stats['response_time']:.2f}秒 | "
+                        f"输入tokens: {stats['prompt_tokens']} | "
+                        f"输出tokens: {stats['completion_tokens']} | "
+                        f"总tokens: {stats['total_tokens']} | "
+                        f"成本: ${total_cost:.4f}"
+                    )
+                    
+                    # 添加性能记录，与统计页面共用同一份按列存储的记录
+                    add_performance_record(
+                        provider,
+                        model,
+                        stats["response_time"],
+                        stats["prompt_tokens"],
+                        stats["completion_tokens"],
+                        total_cost
+                    )
+            
+        except Exception as e:
+            error_msg = str(e)
+            if "未收到模型响应" in error_msg:
+                message_placeholder.error("模型没有生成响应，请重试")
+            else:
+                message_placeholder.error(f"生成响应时出错: {error_msg}")
+            
+            # 移除用户消息（仅在完全失败时）
+            if not parts and st.session_state.messages:
+                st.session_state.messages.pop()
+        
+        finally:
+            # 未使用到模型信息时（如生成失败）取消尚未完成的任务
+            model_info_task.cancel()
+
 async def chat_page():
     """聊天页面"""
     st.title("模型对话测试")
@@ -137,7 +338,9 @@ async def chat_page():
         if "messages" not in st.session_state:
             st.session_state.messages = []
         if "performance_records" not in st.session_state:
-            st.session_state.performance_records = []
+            st.session_state.performance_records = new_performance_records()
+        if "older_messages_shown" not in st.session_state:
+            st.session_state.older_messages_shown = 0
         
         # 侧边栏配置
         with st.sidebar:
@@ -150,115 +353,22 @@ async def chat_page():
             # 清空聊天按钮
             if st.button("清空聊天记录", type="secondary"):
                 st.session_state.messages = []
-                st.session_state.performance_records = []  # 同时清空性能记录
+                st.session_state.performance_records = new_performance_records()  # 同时清空性能记录
+                _clear_chat_history()
                 st.rerun()
         
+        # 按需加载已写入磁盘的更早消息
+        if st.session_state.older_messages_shown < len(st.session_state.get("_chat_history_offsets", ())):
+            if st.button("加载更早的消息"):
+                st.session_state.older_messages_shown += MAX_IN_MEMORY
+        older_messages = _load_older_messages(st.session_state.older_messages_shown)
+        
         # 显示聊天历史
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        for message in older_messages + st.session_state.messages:
+            _render_bubble(message["role"], message["content"])
         
         # 用户输入
-        if prompt := st.chat_input():
-            # 添加用户消息
-            st.session_state.messages.append({
-                "role": "user",
-                "content": prompt
-            })
-            
-            with st.chat_message("user"):
-                st.markdown(prompt)
-            
-            # 调用API
-            with st.chat_message("assistant"):
-                message_placeholder = st.empty()
-                stats_placeholder = st.empty()
-                full_response = ""
-                
-                try:
-                    message_placeholder.markdown("🤔 思考中...")
-                    
-                    # 获取流式响应
-                    response_generator = await LLMServiceFactory.get_service(provider).chat_completion(
-                        messages=[
-                            {"role": msg["role"], "content": msg["content"]}
-                            for msg in st.session_state.messages
-                        ],
-                        model=model,
-                        stream=True
-                    )
-                    
-                    # 处理流式响应
-                    async for chunk in response_generator:
-                        if chunk["type"] == "content":
-                            full_response += chunk["content"]
-                            message_placeholder.markdown(full_response + "▌")
-                        elif chunk["type"] == "stats":
-                            # 显示最终响应（不带光标）
-                            message_placeholder.markdown(full_response)
-                            
-                            # 添加助手消息到历史记录
-                            st.session_state.messages.append({
-                                "role": "assistant",
-                                "content": full_response
-                            })
-                            
-                            # 获取模型信息以计算成本
-                            model_info = await LLMServiceFactory.get_service(provider).get_model_info(model)
-                            
-                            if model_info and model_info.pricing:
-                                # 计算成本
-                                prompt_cost = (
-                                    model_info.pricing["input"] *
-                                    chunk["stats"]["prompt_tokens"] / 1000
-                                )
-                                completion_cost = (
-                                    model_info.pricing["output"] *
-                                    chunk["stats"]["completion_tokens"] / 1000
-                                )
-                                total_cost = prompt_cost + completion_cost
-                                
-                                # 显示统计信息
-                                stats_placeholder.caption(
-                                    f"响应时间: {chunk['stats']['response_time']:.2f}秒 | "
-                                    f"输入tokens: {chunk['stats']['prompt_tokens']} | "
-                                    f"输出tokens: {chunk['stats']['completion_tokens']} | "
-                                    f"总tokens: {chunk['stats']['total_tokens']} | "
-                                    f"成本: ${total_cost:.4f}"
-                                )
-                                
-                                # 添加性能记录
-                                performance_record = {
-                                    "provider": provider,
-                                    "model": model,
-                                    "response_time": chunk["stats"]["response_time"],
-                                    "prompt_tokens": chunk["stats"]["prompt_tokens"],
-                                    "completion_tokens": chunk["stats"]["completion_tokens"],
-                                    "total_tokens": chunk["stats"]["total_tokens"],
-                                    "cost": total_cost
-                                }
-                                
-                                if "performance_records" not in st.session_state:
-                                    st.session_state.performance_records = []
-                                st.session_state.performance_records.append(performance_record)
-                    
-                    # 检查是否有响应
-                    if not full_response:
-                        message_placeholder.error("模型没有生成任何响应")
-                        if st.session_state.messages:
-                            st.session_state.messages.pop()  # 移除用户消息
-                        return
-                    
-                except Exception as e:
-                    error_msg = str(e)
-                    if "未收到模型响应" in error_msg:
-                        message_placeholder.error("模型没有生成响应，请重试")
-                    else:
-                        message_placeholder.error(f"生成响应时出错: {error_msg}")
-                    
-                    # 移除用户消息（仅在完全失败时）
-                    if not full_response and st.session_state.messages:
-                        st.session_state.messages.pop()
-                
+        await _chat_turn(provider, model)
+        
     except Exception as e:
         st.error(f"页面加载出错: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""
+配置管理页面
+"""
+
+from .config_page import config_page, get_env_path
+
+__all__ = ['config_page', 'get_env_path']
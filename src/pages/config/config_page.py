@@ -1,81 +1,82 @@
 import os
 import streamlit as st
-from typing import Dict
-import json
+from typing import Dict, List, Tuple
+import io
+import re
+import asyncio
+import hashlib
+from pathlib import Path
+from services import LLMServiceFactory
+
+# 项目根目录：src 目录的上级目录，找不到名为 src 的目录时按 src/pages/config 的目录结构推算
+_FILE_PARENTS = Path(os.path.abspath(__file__)).parents
+_PROJECT_ROOT = next((p for p in _FILE_PARENTS if p.name == 'src'), _FILE_PARENTS[2]).parent
+_ENV_PATH = str(_PROJECT_ROOT / '.env')
 
 def get_project_root():
     """获取项目根目录"""
-    current_path = os.path.abspath(__file__)
-    # 从当前文件位置向上查找，直到找到包含 src 目录的目录
-    while current_path != '/':
-        if os.path.basename(os.path.dirname(current_path)) == 'src':
-            return os.path.dirname(os.path.dirname(current_path))
-        current_path = os.path.dirname(current_path)
-    # 如果找不到，返回当前文件所在的目录的上两级目录
-    return os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return str(_PROJECT_ROOT)
 
 def get_env_path():
     """获取环境变量文件路径"""
     # 总是返回项目根目录下的 .env 文件路径
-    root_dir = get_project_root()
-    return os.path.join(root_dir, '.env')
+    return _ENV_PATH
 
-def load_env_config() -> Dict[str, str]:
-    """加载环境变量配置"""
+# 匹配环境变量文件中的一行：配置组（## 组名）、配置分类（# 分类）或配置项（键=值）
+_ENV_LINE_PATTERN = re.compile(
+    r"^[ \t]*(?:##[ \t](?P<group>.*?)|#[ \t](?P<section>.*?)|(?P<key>[^=\n]*?)[ \t]*=[ \t]*(?P<value>.*?))[ \t\r]*$",
+    re.M
+)
+
+@st.cache_data(show_spinner=False)
+def _parse_env(path: str, mtime: float) -> Dict[str, Dict[str, str]]:
+    """解析环境变量文件
+    
+    mtime 仅作为缓存键使用，配置文件修改后缓存自动失效
+    """
     config = {}
-    env_path = get_env_path()
+    current_group = None
+    current_section = None
     
-    if os.path.exists(env_path):
-        with open(env_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-            
-        current_group = None
-        current_section = None
+    for match in _ENV_LINE_PATTERN.finditer(Path(path).read_text(encoding='utf-8')):
+        group, section, key = match.group('group', 'section', 'key')
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            if line.startswith('## '):  # 使用双井号标记配置组
-                current_group = line[3:].strip()
-                continue
-                
-            if line.startswith('# '):  # 单井号标记配置分类
-                current_section = line[1:].strip()
-                continue
-                
-            if '=' in line and current_group:  # 配置项
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # 使用默认值处理 None 的情况
-                group = current_group if current_group else '默认配置'
-                section = current_section if current_section else '默认分类'
-                
-                # 使用组名作为前缀创建唯一键名
-                unique_key = f"{group}_{key}"
-                
-                config[unique_key] = {
-                    'value': value,
-                    'section': section,
-                    'group': group,
-                    'original_key': key  # 保存原始键名
-                }
-    
-    # 显示当前使用的配置文件路径
-    st.sidebar.info(f"当前配置文件: {env_path}")
+        if group is not None:  # 使用双井号标记配置组
+            current_group = group.strip()
+            continue
+            
+        if section is not None:  # 单井号标记配置分类
+            current_section = section.strip()
+            continue
+            
+        if current_group:  # 配置项
+            value = match.group('value')
+            
+            # 使用默认值处理 None 的情况
+            group = current_group if current_group else '默认配置'
+            section = current_section if current_section else '默认分类'
+            
+            # 使用组名作为前缀创建唯一键名
+            unique_key = f"{group}_{key}"
+            
+            config[unique_key] = {
+                'value': value,
+                'section': section,
+                'group': group,
+                'original_key': key  # 保存原始键名
+            }
     
     return config
 
-def save_env_config(config: Dict[str, Dict[str, str]]):
-    """保存环境变量配置"""
+def load_env_config() -> Dict[str, str]:
+    """加载环境变量配置"""
     env_path = get_env_path()
-    
-    # 确保目录存在
-    os.makedirs(os.path.dirname(env_path), exist_ok=True)
-    
+    if not os.path.exists(env_path):
+        return {}
+    return _parse_env(env_path, os.path.getmtime(env_path))
+
+def _serialize_env_config(config: Dict[str, Dict[str, str]]) -> str:
+    """将配置序列化为环境变量文件内容"""
     # 按配置组和section分组
     groups = {}
     for key, data in config.items():
@@ -89,31 +90,122 @@ def save_env_config(config: Dict[str, Dict[str, str]]):
         original_key = data.get('original_key', key.split('_', 1)[1] if '_' in key else key)
         groups[group][section].append((original_key, data['value']))
     
-    # 写入文件
-    with open(env_path, 'w', encoding='utf-8') as f:
-        # 按字母顺序排序所有组
-        for group in sorted(groups.keys()):
-            # 写入组标记
-            f.write(f"## {group}\n\n")
-            
-            sections = groups[group]
-            if not sections:  # 如果组没有分类，添加默认分类
-                f.write("# 默认分类\n\n")
-                continue
+    f = io.StringIO()
+    # 按字母顺序排序所有组
+    for group in sorted(groups.keys()):
+        # 写入组标记
+        f.write(f"## {group}\n\n")
+        
+        sections = groups[group]
+        if not sections:  # 如果组没有分类，添加默认分类
+            f.write("# 默认分类\n\n")
+            continue
+        
+        # 按字母顺序排序分类
+        for section in sorted(sections.keys()):
+            # 写入分类标记
+            f.write(f"# {section}\n")
             
-            # 按字母顺序排序分类
-            for section in sorted(sections.keys()):
-                # 写入分类标记
-                f.write(f"# {section}\n")
-                
-                # 写入配置项
-                items = sections[section]
-                if items:  # 只有当有配置项时才写入
-                    for key, value in sorted(items):
-                        f.write(f"{key}={value}\n")
-                f.write("\n")
+            # 写入配置项
+            items = sections[section]
+            if items:  # 只有当有配置项时才写入
+                for key, value in sorted(items):
+                    f.write(f"{key}={value}\n")
+            f.write("\n")
+    
+    return f.getvalue()
+
+def _save_env_sync(env_path: str, content: str):
+    """写入环境变量文件"""
+    # 确保目录存在
+    os.makedirs(os.path.dirname(env_path), exist_ok=True)
+    with open(env_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def _content_hash(data: bytes) -> bytes:
+    """计算文件内容的哈希"""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _prepare_env_save(config: Dict[str, Dict[str, str]]):
+    """生成待写入的文件内容
+    
+    与磁盘上的当前文件比较，而不是与本会话上次写入的内容比较，
+    其他会话或外部编辑修改过的文件不会被误判为无需写入
+    
+    Returns:
+        Optional[str]: 文件内容，与当前文件内容相同时返回 None
+    """
+    st.session_state._env_dirty = False
+    
+    content = _serialize_env_config(config)
+    try:
+        current_hash = _content_hash(Path(get_env_path()).read_bytes())
+    except FileNotFoundError:
+        return content
+    if _content_hash(content.encode('utf-8')) == current_hash:
+        return None
+    return content
+
+def _finish_env_save():
+    """清除依赖配置的缓存"""
+    # 配置变更后清除缓存的服务实例和模型列表，下次使用时按新配置重建
+    LLMServiceFactory.reset()
+    st.session_state.pop("_models_cache", None)
+    st.session_state.pop("_model_info_cache", None)
 
-def config_page():
+async def save_env_config_async(config: Dict[str, Dict[str, str]]):
+    """保存环境变量配置，文件写入在线程池中执行，不阻塞事件循环"""
+    content = _prepare_env_save(config)
+    if content is None:
+        return
+    
+    await asyncio.to_thread(_save_env_sync, get_env_path(), content)
+    _finish_env_save()
+
+@st.cache_data(show_spinner=False)
+def _group_index(config_items: tuple) -> Dict[str, Dict[str, list]]:
+    """按配置组和分类索引配置项
+    
+    Args:
+        config_items: 按键名排序的 (键名, 配置) 元组，同时作为缓存键
+    
+    Returns:
+        Dict[str, Dict[str, list]]: {配置组: {分类: [(键名, 配置), ...]}}，
+            配置组、分类和配置项均已排序
+    """
+    groups = {}
+    for key, data in config_items:
+        group = data.get('group', '默认配置')  # 使用默认值处理 None
+        section = data.get('section', '默认分类')  # 使用默认值处理 None
+        groups.setdefault(group, {}).setdefault(section, []).append((key, data))
+    
+    return {
+        group: {section: groups[group][section] for section in sorted(groups[group])}
+        for group in sorted(groups)
+    }
+
+@st.cache_data(show_spinner=False)
+def _option_lists(config_items: tuple) -> Tuple[List[str], List[str]]:
+    """一次遍历获取已有的配置组和分类，供添加配置时选择
+    
+    Args:
+        config_items: 按键名排序的 (键名, 配置) 元组，同时作为缓存键
+    
+    Returns:
+        Tuple[List[str], List[str]]: 排序后的配置组和分类，均包含默认值
+    """
+    groups_set = {'默认配置'}
+    sections_set = {'默认分类'}
+    for _, data in config_items:
+        groups_set.add(data.get('group', '默认配置'))
+        sections_set.add(data.get('section', '默认分类'))
+    
+    # 确保处理 None 值
+    groups_set.discard(None)
+    sections_set.discard(None)
+    return sorted(groups_set), sorted(sections_set)
+
+async def config_page():
     """配置管理页面"""
     st.title("配置管理")
     
@@ -123,22 +215,20 @@ def config_page():
     if 'show_values' not in st.session_state:
         st.session_state.show_values = {}
     
-    # 每次页面加载时重新读取配置
-    st.session_state.env_config = load_env_config()
+    # 每次页面加载时重新读取配置（配置文件未修改时直接使用缓存），有未保存的修改时保留当前配置
+    if not st.session_state.get('_env_dirty'):
+        st.session_state.env_config = load_env_config()
+    
+    # 显示当前使用的配置文件路径
+    st.sidebar.info(f"当前配置文件: {get_env_path()}")
+    
+    config_items = tuple(sorted(st.session_state.env_config.items()))
     
     # 添加新配置的表单
     with st.expander("添加新配置", expanded=False):
         with st.form("add_config"):
-            # 获取现有的配置组和分类，确保处理 None 值
-            groups = list(set(
-                data.get('group', '默认配置') for data in st.session_state.env_config.values()
-            ))
-            groups = sorted([g for g in groups if g is not None] + ['默认配置'])
-            
-            sections = list(set(
-                data.get('section', '默认分类') for data in st.session_state.env_config.values()
-            ))
-            sections = sorted([s for s in sections if s is not None] + ['默认分类'])
+            # 获取现有的配置组和分类
+            groups, sections = _option_lists(config_items)
             
             # 配置组选择
             col1, col2 = st.columns(2)
@@ -188,7 +278,7 @@ def config_page():
                                 'group': new_group
                             }
                         
-                        save_env_config(st.session_state.env_config)
+                        await save_env_config_async(st.session_state.env_config)
                         st.success(f"已添加 Azure OpenAI 配置组: {new_group}")
                         st.rerun()
             else:
@@ -217,31 +307,25 @@ def config_page():
                             'section': new_section,
                             'group': new_group
                         }
-                        save_env_config(st.session_state.env_config)
+                        await save_env_config_async(st.session_state.env_config)
                         st.success(f"已添加配置: {new_key}")
                         st.rerun()
     
     # 配置组操作
     if st.session_state.env_config:
         # 按配置组和section分组显示
-        groups = {}
-        for key, data in st.session_state.env_config.items():
-            group = data.get('group', '默认配置')  # 使用默认值处理 None
-            section = data.get('section', '默认分类')  # 使用默认值处理 None
-            if group not in groups:
-                groups[group] = {}
-            if section not in groups[group]:
-                groups[group][section] = []
-            groups[group][section].append((key, data))
+        groups = _group_index(tuple(sorted(st.session_state.env_config.items())))
         
         # 显示所有配置组
-        for group in sorted(groups.keys()):
-            sections = groups[group]
+        for group, sections in groups.items():
             with st.expander(f"配置组: {group}", expanded=True):
                 # 配置组操作按钮
                 col1, col2, col3 = st.columns(3)
                 with col1:
                     if st.button(f"导出配置组: {group}", key=f"export_{group}"):
+                        # 仅在导出时导入，减少页面首次加载的导入开销
+                        import orjson
+                        
                         # 创建用于导出的配置（不包含敏感信息）
                         export_config = {}
                         for section, items in sections.items():
@@ -251,7 +335,7 @@ def config_page():
                         
                         st.download_button(
                             f"下载 {group} 配置模板",
-                            data=json.dumps(export_config, indent=2, ensure_ascii=False),
+                            data=orjson.dumps(export_config, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS),
                             file_name=f"{group}_template.json",
                             mime="application/json",
                             key=f"download_{group}"
@@ -269,7 +353,7 @@ def config_page():
                                     'section': data.get('section', '默认分类'),
                                     'group': new_group_name
                                 }
-                        save_env_config(st.session_state.env_config)
+                        await save_env_config_async(st.session_state.env_config)
                         st.success(f"已复制配置组: {new_group_name}")
                         st.rerun()
                 
@@ -286,16 +370,15 @@ def config_page():
                         for key in keys_to_delete:
                             del st.session_state.env_config[key]
                         
-                        save_env_config(st.session_state.env_config)
+                        await save_env_config_async(st.session_state.env_config)
                         st.success(f"已删除配置组: {group}")
                         st.rerun()
                 
                 # 显示每个分类下的配置
-                for section in sorted(sections.keys()):
-                    items = sections[section]
+                for section, items in sections.items():
                     if items:  # 只显示有配置项的分类
                         st.subheader(section)
-                        for key, data in sorted(items):
+                        for key, data in items:
                             col1, col2, col3 = st.columns([3, 1, 1])
                             
                             # 初始化显示状态
@@ -312,9 +395,9 @@ def config_page():
                                     key=f"input_{key}"
                                 )
                                 if new_value != data['value']:
+                                    # 仅标记为已修改，由“保存修改”按钮统一写入文件
                                     st.session_state.env_config[key]['value'] = new_value
-                                    save_env_config(st.session_state.env_config)
-                                    st.success(f"已更新配置: {key}")
+                                    st.session_state._env_dirty = True
                             
                             with col2:
                                 # 显示/隐藏按钮
@@ -323,7 +406,7 @@ def config_page():
                                     key=f"show_{key}"
                                 ):
                                     st.session_state.show_values[key] = not st.session_state.show_values[key]
-                                    st.rerun()
+                                    st.session_state._needs_rerun = True
                             
                             with col3:
                                 # 删除按钮
@@ -331,8 +414,20 @@ def config_page():
                                     del st.session_state.env_config[key]
                                     if key in st.session_state.show_values:
                                         del st.session_state.show_values[key]
-                                    save_env_config(st.session_state.env_config)
+                                    await save_env_config_async(st.session_state.env_config)
                                     st.success(f"已删除配置: {key}")
+                                    # 增删配置项后立即刷新，不再按旧的索引渲染已删除的配置项
                                     st.rerun()
     else:
-        st.info("暂无配置项") 
\ No newline at end of file
+        st.info("暂无配置项")
+    
+    # 统一保存修改过的配置
+    if st.session_state.get('_env_dirty'):
+        st.warning("配置已修改，尚未保存")
+        if st.button("保存修改", type="primary"):
+            await save_env_config_async(st.session_state.env_config)
+            st.success("已保存配置")
+    
+    # 显示状态切换不改变配置项，所有操作处理完后统一刷新一次页面
+    if st.session_state.pop('_needs_rerun', False):
+        st.rerun() 
\ No newline at end of file
@@ -0,0 +1,7 @@
+"""
+主页
+"""
+
+from .home_page import home_page
+
+__all__ = ['home_page']
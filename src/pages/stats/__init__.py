@@ -0,0 +1,7 @@
+"""
+统计页面
+"""
+
+from .stats_page import stats_page
+
+__all__ = ['stats_page']
@@ -1,18 +1,111 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from components.performance_stats import FIGURE_CACHE_ENTRIES, records_frame
+
+# 使用 orjson 序列化图表，减少 st.plotly_chart 的序列化开销
+pio.json.config.default_engine = "orjson"
+
+# 记录数超过该值时，趋势图改用 WebGL 渲染，分布图改为抽样绘制
+WEBGL_THRESHOLD = 5000
+
+# 详细数据表显示的最近记录数
+DETAIL_ROWS = 200
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _model_summary(df: pd.DataFrame) -> pd.DataFrame:
+    """按 (服务提供商, 模型) 一次分组聚合，整体指标和Token图表都由此表得出"""
+    return df.groupby(["provider", "model"], sort=False).agg(
+        count=("response_time", "size"),
+        rt_mean=("response_time", "mean"),
+        rt_std=("response_time", "std"),
+        tok_mean=("total_tokens", "mean"),
+        tok_std=("total_tokens", "std"),
+        prompt_tokens=("prompt_tokens", "sum"),
+        completion_tokens=("completion_tokens", "sum"),
+        cost_sum=("cost", "sum")
+    ).reset_index()
+
+def _pooled_mean_std(counts: pd.Series, means: pd.Series, stds: pd.Series):
+    """由各分组的记录数、均值和标准差合并出整体均值和（样本）标准差"""
+    n = counts.sum()
+    mean = (counts * means).sum() / n
+    if n < 2:
+        return mean, float("nan")
+    m2 = ((counts - 1) * stds.fillna(0) ** 2 + counts * (means - mean) ** 2).sum()
+    return mean, (m2 / (n - 1)) ** 0.5
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _response_time_figure(df: pd.DataFrame):
+    """各模型响应时间分布图"""
+    if len(df) > WEBGL_THRESHOLD:
+        # 箱线图没有 WebGL 版本，抽样后分布基本不变
+        df = df.sample(WEBGL_THRESHOLD, random_state=0)
+    return px.box(
+        df,
+        x="model",
+        y="response_time",
+        color="provider",
+        title="各模型响应时间分布"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _token_usage_figure(summary: pd.DataFrame):
+    """Token使用情况图，使用预先聚合的各模型Token总量"""
+    return px.bar(
+        summary,
+        x="model",
+        y=["prompt_tokens", "completion_tokens"],
+        title="Token使用情况",
+        barmode="group"
+    )
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _cost_trend_figure(df: pd.DataFrame):
+    """成本趋势图，按模型分组后直接以numpy数组构建各条曲线"""
+    x = np.arange(len(df))
+    y = df["cost"].to_numpy()
+    trace = go.Scattergl if len(df) > WEBGL_THRESHOLD else go.Scatter
+    
+    fig = go.Figure()
+    for model, idx in df.groupby("model", sort=False).indices.items():
+        fig.add_trace(trace(x=x[idx], y=y[idx], mode="lines", name=model))
+    fig.update_layout(
+        title="成本趋势",
+        xaxis_title="index",
+        yaxis_title="cost",
+        legend_title_text="model"
+    )
+    return fig
+
+@st.cache_data(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _detail_view(df: pd.DataFrame) -> pd.DataFrame:
+    """最近 DETAIL_ROWS 条记录的展示表，只格式化需要显示的列，不使用 Styler"""
+    view = df.tail(DETAIL_ROWS)
+    return view.assign(
+        response_time=view["response_time"].map("{:.2f}秒".format),
+        cost=view["cost"].map("${:.4f}".format)
+    )
 
 def stats_page():
     """统计页面"""
     st.title("性能统计")
     
     # 检查是否有性能记录
-    if not st.session_state.get("performance_records", []):
+    records = st.session_state.get("performance_records")
+    if not records or not records["timestamp"]:
         st.warning("暂无性能数据。请先进行一些对话测试。")
         return
         
-    # 转换数据为DataFrame
-    df = pd.DataFrame(st.session_state.performance_records)
+    # 转换数据为DataFrame，记录未变化时复用缓存
+    df = records_frame(records)
+    summary = _model_summary(df)
+    rt_mean, rt_std = _pooled_mean_std(summary["count"], summary["rt_mean"], summary["rt_std"])
+    tok_mean, tok_std = _pooled_mean_std(summary["count"], summary["tok_mean"], summary["tok_std"])
+    total_cost = summary["cost_sum"].sum()
     
     # 显示性能仪表板
     col1, col2, col3 = st.columns(3)
@@ -20,22 +113,22 @@ def stats_page():
     with col1:
         st.metric(
             "平均响应时间",
-            f"{df['response_time'].mean():.2f}秒",
-            f"{df['response_time'].std():.2f}秒"
+            f"{rt_mean:.2f}秒",
+            f"{rt_std:.2f}秒"
         )
     
     with col2:
         st.metric(
             "平均Token使用量",
-            f"{df['total_tokens'].mean():.0f}",
-            f"{df['total_tokens'].std():.0f}"
+            f"{tok_mean:.0f}",
+            f"{tok_std:.0f}"
         )
     
     with col3:
         st.metric(
             "总成本",
-            f"${df['cost'].sum():.4f}",
-            f"${df['cost'].mean():.4f}/次"
+            f"${total_cost:.4f}",
+            f"${total_cost / len(df):.4f}/次"
         )
     
     # 显示详细图表
@@ -43,41 +136,17 @@ def stats_page():
     
     with col1:
         st.subheader("响应时间分析")
-        fig = px.box(
-            df,
-            x="model",
-            y="response_time",
-            color="provider",
-            title="各模型响应时间分布"
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(_response_time_figure(df), use_container_width=True)
         
     with col2:
         st.subheader("Token使用分析")
-        fig = px.bar(
-            df,
-            x="model",
-            y=["prompt_tokens", "completion_tokens"],
-            title="Token使用情况",
-            barmode="group"
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(_token_usage_figure(summary), use_container_width=True)
         
     st.subheader("成本分析")
-    fig = px.line(
-        df,
-        x=df.index,
-        y="cost",
-        color="model",
-        title="成本趋势"
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(_cost_trend_figure(df), use_container_width=True)
     
     # 显示原始数据
     st.subheader("详细数据")
-    st.dataframe(
-        df.style.format({
-            "response_time": "{:.2f}秒",
-            "cost": "${:.4f}"
-        })
-    ) 
\ No newline at end of file
+    if len(df) > DETAIL_ROWS:
+        st.caption(f"仅显示最近 {DETAIL_ROWS} 条记录，共 {len(df)} 条")
+    st.dataframe(_detail_view(df))
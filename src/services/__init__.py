@@ -2,13 +2,23 @@
 LLM服务模块
 """
 
+import importlib
 from .base import LLMService, ModelInfo, CompletionResponse
 from .factory import LLMServiceFactory
 
-# 导入所有服务实现，这样它们会被注册到工厂中
-from .openai_service import OpenAIService
-from .azure_openai_service import AzureOpenAIService
-from .anthropic_service import AnthropicService
+# 服务实现按需导入，由 LLMServiceFactory.get_service 在首次使用时导入并注册，
+# 避免在启动时加载所有服务商的SDK
+_LAZY_SERVICES = {
+    'OpenAIService': '.openai_service',
+    'AzureOpenAIService': '.azure_openai_service',
+    'AnthropicService': '.anthropic_service'
+}
+
+def __getattr__(name):
+    if name in _LAZY_SERVICES:
+        module = importlib.import_module(_LAZY_SERVICES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'LLMService',
@@ -18,4 +28,4 @@ __all__ = [
     'OpenAIService',
     'AzureOpenAIService',
     'AnthropicService'
-] 
\ No newline at end of file
+]
@@ -2,8 +2,32 @@ import os
 from typing import List, Dict, Optional
 from anthropic import AsyncAnthropic
 from datetime import datetime
+from types import MappingProxyType
 from .base import LLMService, ModelInfo, CompletionResponse
 from .factory import LLMServiceFactory
+from .tokenizer import count_text_tokens
+
+# Anthropic 消息接口支持的角色
+_ANTHROPIC_ROLES = frozenset({"user", "assistant"})
+
+# 支持的模型及定价（每1k tokens），各服务实例共用
+_MODELS = MappingProxyType({
+    "claude-3-opus": ModelInfo(
+        name="claude-3-opus",
+        max_tokens=200000,
+        pricing={"input": 0.015, "output": 0.075}
+    ),
+    "claude-3-sonnet": ModelInfo(
+        name="claude-3-sonnet",
+        max_tokens=200000,
+        pricing={"input": 0.003, "output": 0.015}
+    ),
+    "claude-3-haiku": ModelInfo(
+        name="claude-3-haiku",
+        max_tokens=200000,
+        pricing={"input": 0.0025, "output": 0.00125}
+    )
+})
 
 @LLMServiceFactory.register("anthropic")
 class AnthropicService(LLMService):
@@ -17,25 +41,10 @@ class AnthropicService(LLMService):
                 "Anthropic配置未完成。请在.env文件中设置ANTHROPIC_API_KEY。"
             )
             
+        self.api_key = api_key
         self.client = AsyncAnthropic(api_key=api_key)
         
-        self.models = {
-            "claude-3-opus": ModelInfo(
-                name="claude-3-opus",
-                max_tokens=200000,
-                pricing={"input": 0.015, "output": 0.075}
-            ),
-            "claude-3-sonnet": ModelInfo(
-                name="claude-3-sonnet",
-                max_tokens=200000,
-                pricing={"input": 0.003, "output": 0.015}
-            ),
-            "claude-3-haiku": ModelInfo(
-                name="claude-3-haiku",
-                max_tokens=200000,
-                pricing={"input": 0.0025, "output": 0.00125}
-            )
-        }
+        self.models = _MODELS
     
     async def get_available_models(self) -> List[str]:
         """获取可用模型列表"""
@@ -60,26 +69,19 @@ class AnthropicService(LLMService):
             if not model:
                 model = "claude-3-sonnet"
                 
-            # 将消息格式转换为Anthropic格式
-            formatted_messages = []
-            for msg in messages:
-                if msg["role"] == "user":
-                    formatted_messages.append({
-                        "role": "user",
-                        "content": msg["content"]
-                    })
-                elif msg["role"] == "assistant":
-                    formatted_messages.append({
-                        "role": "assistant",
-                        "content": msg["content"]
-                    })
+            # 消息已是 {"role", "content"} 格式，只需过滤掉Anthropic不支持的角色
+            formatted_messages = [
+                msg for msg in messages
+                if msg["role"] in _ANTHROPIC_ROLES
+            ]
             
-            response = await self.client.messages.create(
-                model=model,
-                messages=formatted_messages,
-                max_tokens=kwargs.get("max_tokens", 1000),
-                temperature=kwargs.get("temperature", 0.7)
-            )
+            async with self._request_slot():
+                response = await self.client.messages.create(
+                    model=model,
+                    messages=formatted_messages,
+                    max_tokens=kwargs.get("max_tokens", 1000),
+                    temperature=kwargs.get("temperature", 0.7)
+                )
             
             return {
                 "content": response.content[0].text,
@@ -100,12 +102,13 @@ class AnthropicService(LLMService):
         """生成文本"""
         try:
             model = kwargs.get('model', 'claude-3-sonnet')
-            response = await self.client.messages.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
+            async with self._request_slot():
+                response = await self.client.messages.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature
+                )
             
             return CompletionResponse(
                 text=response.content[0].text,
@@ -120,17 +123,23 @@ class AnthropicService(LLMService):
     
     async def count_tokens(self, text: str) -> int:
         """计算文本的token数量"""
-        # 使用简单的估算方法
-        return len(text.split()) * 1.3
+        # Anthropic 没有公开本地分词器，使用 cl100k_base 近似估算
+        return count_text_tokens(text)
+    
+    def _validation_key(self) -> tuple:
+        """连接验证结果按API密钥区分"""
+        return (type(self).__name__, self.api_key)
     
     async def validate_connection(self) -> bool:
-        """验证API连接是否正常"""
-        try:
-            await self.client.messages.create(
-                model="claude-3-haiku",
-                messages=[{"role": "user", "content": "test"}],
-                max_tokens=1
-            )
+        """验证API连接是否正常
+        
+        请求模型列表接口的第一页，不发起计费的补全请求；验证成功后 VALIDATION_TTL 秒内直接返回
+        """
+        if self._recently_validated():
             return True
+        try:
+            await self.client.models.list(limit=1)
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+        self._mark_validated()
+        return True 
\ No newline at end of file
@@ -1,10 +1,75 @@
 import os
+import asyncio
+import numpy as np
+import re
+from functools import lru_cache
 from typing import List, Dict, Optional, AsyncGenerator, Union
 from openai import AsyncAzureOpenAI
 from datetime import datetime
-import tiktoken
 from .base import LLMService, ModelInfo, CompletionResponse
 from .factory import LLMServiceFactory
+from .tokenizer import count_text_tokens, get_encoding
+
+# Azure OpenAI 配置文件路径，按顺序查找
+_AZURE_ENV_PATHS = (
+    "/mount/src/check-llm/.env",  # 线上环境路径
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')  # 本地环境路径
+)
+
+# 匹配配置组标题（## 组名）或 AZURE_ 开头的键值对，其余行（注释等）不匹配
+_AZURE_ENV_PATTERN = re.compile(
+    r"^[ \t]*(?:##[ \t](?P<group>.*?)|(?P<key>AZURE_\w*)[ \t]*=[ \t]*(?P<value>.*?))[ \t\r]*$",
+    re.M
+)
+
+_ENV_PLACEHOLDERS = frozenset({
+    'your_azure_openai_api_key',
+    'your_aws_api_key',
+    'your_google_api_key'
+})
+
+# Azure OpenAI 接口支持的补全参数，其余参数在调用前移除
+_AZURE_SUPPORTED = frozenset({
+    "temperature",
+    "max_tokens",
+    "top_p",
+    "frequency_penalty",
+    "presence_penalty",
+    "stop"
+})
+
+@lru_cache(maxsize=1)
+def _parse_azure_configs(env_path: str, mtime: float) -> Dict[str, Dict[str, str]]:
+    """一次读取并解析配置文件中的所有 Azure OpenAI 配置组
+    
+    mtime 仅作为缓存键使用，配置文件修改后缓存自动失效
+    """
+    with open(env_path, 'r', encoding='utf-8') as f:
+        data = f.read()
+    
+    env_vars = {}
+    current_group = None
+    for match in _AZURE_ENV_PATTERN.finditer(data):
+        group = match.group('group')
+        if group is not None:
+            current_group = group.strip()
+            continue
+        value = match.group('value')
+        if current_group and value and value not in _ENV_PLACEHOLDERS:
+            env_vars.setdefault(current_group, {})[match.group('key')] = value
+    
+    # 解析配置
+    configs = {}
+    for group, vars in env_vars.items():
+        if all(key in vars for key in ['AZURE_OPENAI_API_KEY', 'AZURE_OPENAI_ENDPOINT', 'AZURE_DEPLOYMENT_NAME']):
+            configs[group] = {
+                "api_key": vars['AZURE_OPENAI_API_KEY'],
+                "endpoint": vars['AZURE_OPENAI_ENDPOINT'],
+                "deployment_name": vars['AZURE_DEPLOYMENT_NAME'],
+                "api_version": vars.get('AZURE_OPENAI_API_VERSION', "2024-02-15-preview")
+            }
+    
+    return configs
 
 @LLMServiceFactory.register("azure-openai")
 class AzureOpenAIService(LLMService):
@@ -25,15 +90,20 @@ class AzureOpenAIService(LLMService):
         # 初始化所有配置的客户端和模型信息
         self.clients = {}
         self.models = {}
-        self.encodings = {}
+        # 相同 (endpoint, api_key, api_version) 的配置组共用一个客户端及其连接池
+        self._shared_clients = {}
         
         for config_name, config in self.configs.items():
             try:
-                client = AsyncAzureOpenAI(
-                    api_key=config["api_key"],
-                    api_version=config.get("api_version", "2024-02-15-preview"),
-                    azure_endpoint=config["endpoint"]
-                )
+                api_version = config.get("api_version", "2024-02-15-preview")
+                client_key = (config["endpoint"], config["api_key"], api_version)
+                client = self._shared_clients.get(client_key)
+                if client is None:
+                    client = self._shared_clients[client_key] = AsyncAzureOpenAI(
+                        api_key=config["api_key"],
+                        api_version=api_version,
+                        azure_endpoint=config["endpoint"]
+                    )
                 
                 deployment_name = config["deployment_name"]
                 model_type = "gpt-4" if "gpt-4" in deployment_name.lower() else "gpt-35-turbo"
@@ -50,61 +120,31 @@ class AzureOpenAIService(LLMService):
                     )
                 }
                 
-                # 初始化 tiktoken 编码器
-                self.encodings[config_name] = tiktoken.get_encoding("cl100k_base")
-                
             except Exception as e:
                 st.warning(f"初始化配置 '{config_name}' 失败: {str(e)}")
+        
+        # 未指定模型时使用的默认模型（第一个可用的模型）
+        self._default_model = next(
+            (
+                f"{config_name} - {deployment_name}"
+                for config_name, models in self.models.items()
+                for deployment_name in models
+            ),
+            None
+        )
+    
+    @property
+    def encoding(self):
+        """所有配置组共用的 cl100k_base 编码器"""
+        return get_encoding("cl100k_base")
     
     def _load_azure_configs(self):
         """从环境变量加载所有 Azure OpenAI 配置"""
-        configs = {}
-        
-        # 获取所有环境变量
-        env_vars = {}
-        env_paths = [
-            "/mount/src/check-llm/.env",  # 线上环境路径
-            os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), '.env')  # 本地环境路径
-        ]
-        
-        for env_path in env_paths:
+        for env_path in _AZURE_ENV_PATHS:
             if os.path.exists(env_path):
-                with open(env_path, 'r', encoding='utf-8') as f:
-                    current_group = None
-                    for line in f:
-                        line = line.strip()
-                        if not line:
-                            continue
-                        if line.startswith('## '):
-                            current_group = line[3:].strip()
-                            continue
-                        if line.startswith('#'):
-                            continue
-                        if '=' in line and current_group:
-                            key, value = line.split('=', 1)
-                            key = key.strip()
-                            value = value.strip()
-                            if key.startswith('AZURE_') and value and value not in [
-                                'your_azure_openai_api_key',
-                                'your_aws_api_key',
-                                'your_google_api_key'
-                            ]:
-                                if current_group not in env_vars:
-                                    env_vars[current_group] = {}
-                                env_vars[current_group][key] = value.strip()
-                break  # 找到第一个存在的配置文件后就停止
-        
-        # 解析配置
-        for group, vars in env_vars.items():
-            if all(key in vars for key in ['AZURE_OPENAI_API_KEY', 'AZURE_OPENAI_ENDPOINT', 'AZURE_DEPLOYMENT_NAME']):
-                configs[group] = {
-                    "api_key": vars['AZURE_OPENAI_API_KEY'],
-                    "endpoint": vars['AZURE_OPENAI_ENDPOINT'],
-                    "deployment_name": vars['AZURE_DEPLOYMENT_NAME'],
-                    "api_version": vars.get('AZURE_OPENAI_API_VERSION', "2024-02-15-preview")
-                }
-        
-        return configs
+                # 找到第一个存在的配置文件后就停止，文件未修改时直接复用解析结果
+                return dict(_parse_azure_configs(env_path, os.path.getmtime(env_path)))
+        return {}
     
     async def get_available_models(self) -> List[str]:
         """获取可用模型列表"""
@@ -130,20 +170,18 @@ class AzureOpenAIService(LLMService):
     
     def count_message_tokens(self, messages: List[Dict[str, str]], config_name: str) -> int:
         """使用 tiktoken 计算消息的 token 数量"""
-        encoding = self.encodings[config_name]
-        num_tokens = 0
-        for message in messages:
-            num_tokens += 4  # 每个消息都有一个系统级别的格式标记
-            for key, value in message.items():
-                num_tokens += len(encoding.encode(str(value)))
-                if key == "name":  # 如果消息中包含名字
-                    num_tokens += -1  # 名字的 token 计数规则略有不同
+        # 一次批量编码所有字段，编码在 tiktoken 的线程池中并行执行
+        strings = [str(value) for message in messages for value in message.values()]
+        encoded = self.encoding.encode_batch(strings, num_threads=os.cpu_count() or 1)
+        num_tokens = int(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)).sum())
+        num_tokens += 4 * len(messages)  # 每个消息都有一个系统级别的格式标记
+        num_tokens -= sum(1 for message in messages if "name" in message)  # 名字的 token 计数规则略有不同
         num_tokens += 2  # 对话的结束标记
         return num_tokens
 
     def count_completion_tokens(self, text: str, config_name: str) -> int:
         """使用 tiktoken 计算完成响应的 token 数量"""
-        return len(self.encodings[config_name].encode(text))
+        return len(self.encoding.encode(text))
     
     async def chat_completion(
         self,
@@ -156,7 +194,9 @@ class AzureOpenAIService(LLMService):
         try:
             if not model:
                 # 使用第一个可用的模型
-                model = await self.get_available_models()[0]
+                model = self._default_model
+                if model is None:
+                    raise ValueError("没有可用的模型")
             
             # 解析配置名称和部署名称
             config_name, deployment_name = model.split(" - ", 1)
@@ -169,46 +209,40 @@ class AzureOpenAIService(LLMService):
             input_tokens = self.count_message_tokens(messages, config_name)
             
             # 移除Azure OpenAI不支持的参数
-            supported_params = {
-                "temperature",
-                "max_tokens",
-                "top_p",
-                "frequency_penalty",
-                "presence_penalty",
-                "stop"
-            }
             filtered_kwargs = {
                 k: v for k, v in kwargs.items() 
-                if k in supported_params
+                if k in _AZURE_SUPPORTED
             }
             
             async def stream_response():
-                full_content = ""
+                chunks = []
                 start_time = datetime.now()
                 
-                response = await client.chat.completions.create(
-                    model=deployment_name,
-                    messages=messages,
-                    stream=True,
-                    **filtered_kwargs
-                )
-                
-                async for chunk in response:
-                    try:
-                        if (chunk.choices and 
-                            chunk.choices[0].delta and 
-                            hasattr(chunk.choices[0].delta, 'content') and 
-                            chunk.choices[0].delta.content):
+                # 流式响应在读取完毕前一直占用连接，读取过程同样计入并发数
+                async with self._request_slot():
+                    response = await client.chat.completions.create(
+                        model=deployment_name,
+                        messages=messages,
+                        stream=True,
+                        **filtered_kwargs
+                    )
+                    
+                    async for chunk in response:
+                        # 没有 choices 或 delta 的数据块（如内容过滤结果）直接跳过
+                        try:
                             content = chunk.choices[0].delta.content
-                            full_content += content
-                            yield {
-                                "type": "content",
-                                "content": content
-                            }
-                    except (IndexError, AttributeError):
-                        continue
+                        except (IndexError, AttributeError):
+                            continue
+                        if not content:
+                            continue
+                        chunks.append(content)
+                        yield {
+                            "type": "content",
+                            "content": content
+                        }
                 
                 # 计算完成响应的 token 数量
+                full_content = "".join(chunks)
                 completion_tokens = self.count_completion_tokens(full_content, config_name)
                 total_tokens = input_tokens + completion_tokens
                 
@@ -229,12 +263,13 @@ class AzureOpenAIService(LLMService):
                 return stream_response()
             
             # 非流式输出
-            response = await client.chat.completions.create(
-                model=deployment_name,
-                messages=messages,
-                stream=False,
-                **filtered_kwargs
-            )
+            async with self._request_slot():
+                response = await client.chat.completions.create(
+                    model=deployment_name,
+                    messages=messages,
+                    stream=False,
+                    **filtered_kwargs
+                )
             
             completion_tokens = self.count_completion_tokens(response.choices[0].message.content, config_name)
             
@@ -258,26 +293,19 @@ class AzureOpenAIService(LLMService):
         """生成文本"""
         try:
             # 移除Azure OpenAI不支持的参数
-            supported_params = {
-                "temperature",
-                "max_tokens",
-                "top_p",
-                "frequency_penalty",
-                "presence_penalty",
-                "stop"
-            }
             filtered_kwargs = {
                 k: v for k, v in kwargs.items() 
-                if k in supported_params
+                if k in _AZURE_SUPPORTED
             }
             
-            response = await self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                **filtered_kwargs
-            )
+            async with self._request_slot():
+                response = await self.client.chat.completions.create(
+                    model=self.deployment_name,
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **filtered_kwargs
+                )
             
             return CompletionResponse(
                 text=response.choices[0].message.content,
@@ -292,17 +320,29 @@ class AzureOpenAIService(LLMService):
     
     async def count_tokens(self, text: str) -> int:
         """计算文本的token数量"""
-        # 使用简单的估算方法
-        return len(text.split()) * 1.3
+        return count_text_tokens(text)
+    
+    def _validation_key(self) -> tuple:
+        """连接验证结果按所有 Azure 资源的 (endpoint, api_key, api_version) 区分"""
+        return (type(self).__name__, tuple(sorted(self._shared_clients)))
+    
+    async def aclose(self):
+        """关闭所有配置组共用的客户端"""
+        await asyncio.gather(*(client.close() for client in self._shared_clients.values()))
     
     async def validate_connection(self) -> bool:
-        """验证API连接是否正常"""
-        try:
-            await self.client.chat.completions.create(
-                model=self.deployment_name,
-                messages=[{"role": "user", "content": "test"}],
-                max_tokens=1
-            )
+        """验证API连接是否正常
+        
+        并发请求各 Azure 资源的模型列表接口，不发起计费的补全请求；
+        验证成功后 VALIDATION_TTL 秒内直接返回
+        """
+        if not self._shared_clients:
+            return False
+        if self._recently_validated():
             return True
+        try:
+            await asyncio.gather(*(client.models.list() for client in self._shared_clients.values()))
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+        self._mark_validated()
+        return True 
\ No newline at end of file
@@ -1,16 +1,23 @@
+import time
+import hashlib
+import asyncio
+import weakref
 from abc import ABC, abstractmethod
 from typing import Dict, List, Optional, Any
 from datetime import datetime
-from pydantic import BaseModel
+from dataclasses import dataclass
+from utils.config import get_settings
 
-class Message(BaseModel):
+@dataclass(frozen=True, slots=True)
+class Message:
     """聊天消息模型"""
     role: str
     content: str
     name: Optional[str] = None
     function_call: Optional[Dict[str, Any]] = None
-    
-class CompletionResponse(BaseModel):
+
+@dataclass(frozen=True, slots=True)
+class CompletionResponse:
     """补全响应"""
     text: str
     model: str
@@ -18,16 +25,59 @@ class CompletionResponse(BaseModel):
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
-    
-class ModelInfo(BaseModel):
+
+@dataclass(frozen=True, slots=True)
+class ModelInfo:
     """模型信息"""
     name: str
     max_tokens: int
     pricing: Optional[Dict[str, float]] = None  # input和output的价格（每1k tokens）
 
+# 连接验证成功后的结果缓存时间（秒）
+VALIDATION_TTL = 30.0
+
+# 最近一次连接验证成功的时间（time.monotonic），按 LLMService._validation_key 的摘要记录，
+# 不在进程内长期保存明文凭据。服务实例只在一次页面运行内使用，验证结果需要跨运行保留
+_validated_at: Dict[str, float] = {}
+
 class LLMService(ABC):
     """LLM服务基类"""
     
+    def _request_slot(self) -> asyncio.Semaphore:
+        """获取限制并发请求数的信号量，上限由 Settings.max_concurrent_requests 配置（默认20）
+        
+        信号量按事件循环分别创建，直接创建的服务实例也可以在多个事件循环中使用
+        """
+        semaphores = self.__dict__.setdefault("_request_semaphores", weakref.WeakKeyDictionary())
+        loop = asyncio.get_running_loop()
+        semaphore = semaphores.get(loop)
+        if semaphore is None:
+            semaphore = semaphores[loop] = asyncio.Semaphore(get_settings().max_concurrent_requests)
+        return semaphore
+    
+    def _validation_key(self) -> tuple:
+        """连接验证结果的缓存键，默认按服务类型区分，凭据可变的服务应将凭据加入键中，缓存中只保存键的摘要"""
+        return (type(self).__name__,)
+    
+    def _validation_digest(self) -> str:
+        """连接验证结果缓存键的 SHA-256 摘要"""
+        return hashlib.sha256(repr(self._validation_key()).encode('utf-8')).hexdigest()
+    
+    def _recently_validated(self) -> bool:
+        """VALIDATION_TTL 秒内是否验证成功过"""
+        validated_at = _validated_at.get(self._validation_digest())
+        return validated_at is not None and time.monotonic() - validated_at < VALIDATION_TTL
+    
+    def _mark_validated(self):
+        """记录连接验证成功"""
+        _validated_at[self._validation_digest()] = time.monotonic()
+    
+    async def aclose(self):
+        """关闭服务持有的客户端及其连接池，由工厂在页面运行结束时调用"""
+        client = getattr(self, "client", None)
+        if client is not None:
+            await client.close()
+    
     @abstractmethod
     async def get_available_models(self) -> List[str]:
         """获取可用模型列表"""
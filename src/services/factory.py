@@ -1,11 +1,30 @@
-from typing import Dict, Type
+import asyncio
+import importlib
+import threading
+import weakref
+from typing import Dict, List, Type
 from .base import LLMService
 
+# 服务提供商对应的实现模块，按需导入以避免加载未使用的SDK
+_PROVIDER_MODULES: Dict[str, str] = {
+    "openai": ".openai_service",
+    "azure-openai": ".azure_openai_service",
+    "anthropic": ".anthropic_service",
+}
+
 class LLMServiceFactory:
     """LLM服务工厂"""
     
     _services: Dict[str, Type[LLMService]] = {}
     
+    # 服务实例按事件循环缓存。页面每次运行都通过 asyncio.run 在新的事件循环中执行，
+    # 客户端的连接池绑定创建它的事件循环，因此实例只在同一次运行（同一会话）内复用，
+    # 运行结束时由 aclose 关闭
+    _instances: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, LLMService]]" = weakref.WeakKeyDictionary()
+    # 本次运行中被 reset 移除、尚未关闭的实例
+    _retired: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, List[LLMService]]" = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+    
     @classmethod
     def register(cls, provider: str):
         """注册服务"""
@@ -16,12 +35,59 @@ class LLMServiceFactory:
     
     @classmethod
     def get_service(cls, provider: str) -> LLMService:
-        """获取服务实例"""
+        """获取服务实例，同一事件循环内每个服务提供商只创建一次并复用其客户端连接池"""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            instances = cls._instances.setdefault(loop, {})
+        instance = instances.get(provider)
+        if instance is not None:
+            return instance
+        
+        if provider not in cls._services and provider in _PROVIDER_MODULES:
+            # 导入模块时服务类会通过 register 装饰器注册到工厂中
+            importlib.import_module(_PROVIDER_MODULES[provider], __package__)
         if provider not in cls._services:
             raise ValueError(f"未知的服务提供商: {provider}")
-        return cls._services[provider]()
+        instance = instances[provider] = cls._services[provider]()
+        return instance
+    
+    @classmethod
+    def reset(cls, provider: str = None):
+        """清除当前事件循环中缓存的服务实例，配置变更后调用，下次获取时按新配置重建
+        
+        被清除的实例仍由 aclose 在运行结束时关闭
+        
+        Args:
+            provider: 服务提供商，为空时清除全部
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中时没有缓存的实例
+            return
+        
+        with cls._lock:
+            instances = cls._instances.get(loop)
+            if not instances:
+                return
+            retired = cls._retired.setdefault(loop, [])
+            if provider is None:
+                retired.extend(instances.values())
+                instances.clear()
+            elif provider in instances:
+                retired.append(instances.pop(provider))
+    
+    @classmethod
+    async def aclose(cls):
+        """关闭当前事件循环中创建的所有服务实例，在事件循环关闭前调用"""
+        loop = asyncio.get_running_loop()
+        with cls._lock:
+            services = [*cls._instances.pop(loop, {}).values(), *cls._retired.pop(loop, [])]
+        await asyncio.gather(*(service.aclose() for service in services), return_exceptions=True)
     
     @classmethod
     def get_available_providers(cls) -> list:
         """获取可用的服务提供商列表"""
-        return list(cls._services.keys()) 
\ No newline at end of file
+        providers = list(_PROVIDER_MODULES)
+        providers.extend(p for p in cls._services if p not in _PROVIDER_MODULES)
+        return providers
@@ -1,27 +1,88 @@
-from typing import List, Optional, Dict
+import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from types import MappingProxyType
+from typing import Dict, Final, List, Mapping, Optional, Tuple
 import google.generativeai as genai
-from tenacity import retry, stop_after_attempt, wait_exponential
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential
+)
 
-from .base import BaseLLMService, Message, CompletionResponse, ModelInfo
-from ..utils.exceptions import (
+from utils.exceptions import (
     APIKeyNotFoundError,
     ModelNotFoundError,
     RateLimitError,
     InvalidRequestError,
     LLMServiceError
 )
-from ..utils.config import settings
+from utils.config import get_settings
+from .base import LLMService, Message, CompletionResponse, ModelInfo
+
+# 仅在速率限制时重试，使用全抖动指数退避，避免并发请求同时重试
+_retry_on_rate_limit = retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=1, max=30),
+    retry=retry_if_exception_type(RateLimitError),
+    reraise=True
+)
+
+# 按错误信息对API异常分类，速率限制优先于无效请求
+_RATE_LIMIT_ERROR = re.compile(r"quota|rate.?limit", re.IGNORECASE)
+_INVALID_REQUEST_ERROR = re.compile(r"invalid", re.IGNORECASE)
+
+# token计数缓存的最大条目数
+_TOKEN_CACHE_SIZE = 1024
+
+# 估算token数量时按非空白字符序列计数单词
+_WORD_PATTERN = re.compile(r"\S+")
 
-class GoogleService(BaseLLMService):
+# Google PaLM的定价信息（美元/1K tokens）
+_PRICING: Final[Mapping[str, Mapping[str, float]]] = MappingProxyType({
+    "gemini-pro": MappingProxyType({
+        "input": 0.00025,   # $0.00025/1K tokens
+        "output": 0.0005    # $0.0005/1K tokens
+    }),
+    "gemini-pro-vision": MappingProxyType({
+        "input": 0.00025,
+        "output": 0.0005
+    })
+})
+
+_genai_lock = threading.Lock()
+_genai_api_key: Optional[str] = None
+
+def _configure_genai(api_key: str):
+    """配置 genai 全局客户端，同一密钥只配置一次"""
+    global _genai_api_key
+    with _genai_lock:
+        if _genai_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _genai_api_key = api_key
+
+def _usage_tokens(response) -> Tuple[int, int]:
+    """从响应的 usage_metadata 读取输入和输出token数，与计费口径一致"""
+    usage = response.usage_metadata
+    return usage.prompt_token_count or 0, usage.candidates_token_count or 0
+
+class GoogleService(LLMService):
     """Google PaLM服务实现"""
     
     def __init__(self):
         """初始化Google PaLM客户端"""
+        settings = get_settings()
         if not settings.google_api_key:
             raise APIKeyNotFoundError("Google API key not found")
         
-        genai.configure(api_key=settings.google_api_key)
+        _configure_genai(settings.google_api_key)
         self.default_model = "gemini-pro"
+        self.api_key = settings.google_api_key
+        self._token_counts: "OrderedDict[bytes, int]" = OrderedDict()
         
         # 初始化模型
         try:
@@ -29,11 +90,7 @@ class GoogleService(BaseLLMService):
         except Exception as e:
             raise LLMServiceError(f"Failed to initialize Google PaLM model: {str(e)}")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10),
-        reraise=True
-    )
+    @_retry_on_rate_limit
     async def generate_text(
         self,
         prompt: str,
@@ -50,31 +107,34 @@ class GoogleService(BaseLLMService):
                 "max_output_tokens": max_tokens
             }
             
-            response = self.model.generate_content(
-                prompt,
-                generation_config=generation_config
-            )
+            # 使用异步接口，生成过程中不阻塞事件循环
+            async with self._request_slot():
+                response = await self.model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config
+                )
             
-            # 计算token数量（Google API目前不直接提供token计数）
-            prompt_tokens = await self.count_tokens(prompt)
-            completion_tokens = await self.count_tokens(response.text)
+            prompt_tokens, completion_tokens = _usage_tokens(response)
             
             return CompletionResponse(
                 text=response.text,
                 model=self.default_model,
+                created_at=datetime.now(),
                 prompt_tokens=prompt_tokens,
                 completion_tokens=completion_tokens,
                 total_tokens=prompt_tokens + completion_tokens
             )
             
         except Exception as e:
-            if "quota" in str(e).lower():
-                raise RateLimitError(f"Google PaLM API rate limit exceeded: {str(e)}")
-            elif "invalid" in str(e).lower():
-                raise InvalidRequestError(f"Invalid request to Google PaLM API: {str(e)}")
+            message = str(e)
+            if _RATE_LIMIT_ERROR.search(message):
+                raise RateLimitError(f"Google PaLM API rate limit exceeded: {message}")
+            elif _INVALID_REQUEST_ERROR.search(message):
+                raise InvalidRequestError(f"Invalid request to Google PaLM API: {message}")
             else:
-                raise LLMServiceError(f"Google PaLM API error: {str(e)}")
+                raise LLMServiceError(f"Google PaLM API error: {message}")
     
+    @_retry_on_rate_limit
     async def chat_complete(
         self,
         messages: List[Message],
@@ -84,72 +144,115 @@ class GoogleService(BaseLLMService):
     ) -> CompletionResponse:
         """聊天完成"""
         try:
-            chat = self.model.start_chat(history=[])
+            # 一次请求发送完整对话历史，assistant 角色在Gemini中为 model
+            contents = [
+                {
+                    "role": "model" if message.role == "assistant" else "user",
+                    "parts": [message.content]
+                }
+                for message in messages
+                if message.role in ("user", "assistant")
+            ]
             
-            for message in messages:
-                if message.role == "user":
-                    response = chat.send_message(
-                        message.content,
-                        generation_config={
-                            "temperature": temperature,
-                            "top_p": kwargs.get("top_p", 0.95),
-                            "top_k": kwargs.get("top_k", 40),
-                            "max_output_tokens": max_tokens
-                        }
-                    )
+            async with self._request_slot():
+                response = await self.model.generate_content_async(
+                    contents,
+                    generation_config={
+                        "temperature": temperature,
+                        "top_p": kwargs.get("top_p", 0.95),
+                        "top_k": kwargs.get("top_k", 40),
+                        "max_output_tokens": max_tokens
+                    }
+                )
             
-            # 计算token数量
-            prompt_tokens = sum(await self.count_tokens(msg.content) for msg in messages)
-            completion_tokens = await self.count_tokens(response.text)
+            prompt_tokens, completion_tokens = _usage_tokens(response)
             
             return CompletionResponse(
                 text=response.text,
                 model=self.default_model,
+                created_at=datetime.now(),
                 prompt_tokens=prompt_tokens,
                 completion_tokens=completion_tokens,
                 total_tokens=prompt_tokens + completion_tokens
             )
             
         except Exception as e:
-            raise LLMServiceError(f"Google PaLM chat completion error: {str(e)}")
+            message = str(e)
+            if _RATE_LIMIT_ERROR.search(message):
+                raise RateLimitError(f"Google PaLM API rate limit exceeded: {message}")
+            raise LLMServiceError(f"Google PaLM chat completion error: {message}")
     
-    async def get_model_info(self) -> ModelInfo:
-        """获取模型信息"""
-        # Google PaLM的定价信息（美元/1K tokens）
-        pricing = {
-            "gemini-pro": {
-                "input": 0.00025,   # $0.00025/1K tokens
-                "output": 0.0005    # $0.0005/1K tokens
-            },
-            "gemini-pro-vision": {
-                "input": 0.00025,
-                "output": 0.0005
-            }
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = None,
+        **kwargs
+    ) -> Dict:
+        """聊天补全，model 参数被忽略，始终使用 default_model"""
+        response = await self.chat_complete(
+            [Message(role=message["role"], content=message["content"]) for message in messages],
+            **kwargs
+        )
+        return {
+            "content": response.text,
+            "prompt_tokens": response.prompt_tokens,
+            "completion_tokens": response.completion_tokens,
+            "total_tokens": response.total_tokens
         }
-        
+    
+    async def get_available_models(self) -> List[str]:
+        """获取可用模型列表"""
+        return [self.default_model]
+    
+    async def get_model_info(self, model_name: str = None) -> ModelInfo:
+        """获取模型信息"""
+        # Google的最新大语言模型，具有强大的理解和生成能力
+        model_name = model_name or self.default_model
+        if model_name != self.default_model:
+            raise ModelNotFoundError(f"未知的模型: {model_name}")
+        pricing = _PRICING.get(model_name)
         return ModelInfo(
-            id=self.default_model,
-            name="Gemini Pro",
-            provider="Google",
-            description="Google的最新大语言模型，具有强大的理解和生成能力",
+            name=model_name,
             max_tokens=30720,  # Gemini Pro的上下文窗口
-            pricing=pricing.get(self.default_model)
+            pricing=dict(pricing) if pricing else None
         )
     
     async def count_tokens(self, text: str) -> int:
-        """计算文本的token数量"""
+        """计算文本的token数量
+        
+        调用Gemini的 count_tokens 接口，结果按文本的SHA-256摘要缓存，
+        重复的文本（如系统提示）不再重复请求
+        """
+        key = hashlib.sha256(text.encode("utf-8")).digest()
+        count = self._token_counts.get(key)
+        if count is not None:
+            self._token_counts.move_to_end(key)
+            return count
+        
         try:
-            # Google目前没有提供直接的token计数API
-            # 使用简单估算方法：按照GPT-3的统计，每个单词平均对应1.3个token
-            return len(text.split()) * 1.3
+            response = await asyncio.to_thread(self.model.count_tokens, text)
+            count = response.total_tokens
         except Exception:
-            return len(text.split()) * 1.3
+            # 接口不可用时使用简单估算方法：按照GPT-3的统计，每个单词平均对应1.3个token
+            return round(sum(1 for _ in _WORD_PATTERN.finditer(text)) * 1.3)
+        
+        self._token_counts[key] = count
+        if len(self._token_counts) > _TOKEN_CACHE_SIZE:
+            self._token_counts.popitem(last=False)
+        return count
+    
+    def _validation_key(self) -> tuple:
+        """连接验证结果按API密钥区分"""
+        return (type(self).__name__, self.api_key)
     
     async def validate_connection(self) -> bool:
-        """验证API连接是否正常"""
+        """验证API连接是否正常，验证成功后 VALIDATION_TTL 秒内直接返回"""
+        if self._recently_validated():
+            return True
         try:
-            # 发送一个简单的测试消息
-            response = self.model.generate_content("test")
-            return response.text is not None
+            # 获取模型列表的第一页即可确认连接，不消耗生成token
+            await asyncio.to_thread(lambda: next(iter(genai.list_models()), None))
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+        self._mark_validated()
+        return True 
\ No newline at end of file
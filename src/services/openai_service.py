@@ -1,9 +1,163 @@
 import os
+import math
+import random
+import asyncio
+import threading
+from collections import OrderedDict
+import httpx
 from typing import List, Dict, Optional
+import openai
 from openai import AsyncOpenAI
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_random_exponential
+)
+from utils.exceptions import RateLimitError
+from utils.config import get_settings
+from utils.semantic_cache import SemanticCache
+from dataclasses import replace
 from datetime import datetime
+from types import MappingProxyType
 from .base import LLMService, ModelInfo, CompletionResponse
 from .factory import LLMServiceFactory
+from .tokenizer import count_text_tokens, get_encoding
+
+# 单次批量请求的token上限，低于接口限制（300k）留出余量
+_BATCH_TOKEN_LIMIT = 290_000
+
+# 批量补全未指定 max_tokens 时使用的默认值。Completions 接口缺省只生成16个token，
+# 不能像 Chat Completions 那样省略该参数
+_COMPLETION_DEFAULT_MAX_TOKENS = 1024
+
+def _estimate_tokens_from_bytes(num_bytes: int) -> int:
+    """按 OpenAI 批量接口的估算方式（UTF-8 字节数 × 0.25，向上取整）估算token数"""
+    return math.ceil(num_bytes * 0.25)
+
+def _pack_prompts(prompts: List[str], limit: int = _BATCH_TOKEN_LIMIT) -> List[List[str]]:
+    """按顺序贪心地将提示分组，使每组的估算token数不超过 limit
+    
+    每个提示只编码一次，单个提示超过上限时单独成组
+    """
+    batches = []
+    current = []
+    current_bytes = 0
+    for prompt in prompts:
+        size = len(prompt.encode("utf-8"))
+        if current and _estimate_tokens_from_bytes(current_bytes + size) > limit:
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(prompt)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+# Batch API 任务的失败终止状态
+_BATCH_FAILED_STATUSES = frozenset({"failed", "expired", "cancelled", "cancelling"})
+
+def _parse_batch_results(output: bytes, errors: bytes, total: int) -> List[CompletionResponse]:
+    """解析批量任务的输出文件和错误文件
+    
+    Args:
+        output: 输出文件内容（JSONL）
+        errors: 错误文件内容（JSONL）
+        total: 提交的请求数
+        
+    Returns:
+        List[CompletionResponse]: 按 custom_id 序号排列、与提交时提示顺序一致的响应结果
+        
+    Raises:
+        ValueError: 有请求失败，或结果与提交的请求不一一对应
+    """
+    import orjson
+    
+    results = {}
+    failures = {}
+    for line in output.splitlines() + errors.splitlines():
+        if not line.strip():
+            continue
+        item = orjson.loads(line)
+        index = int(item["custom_id"].rsplit("-", 1)[1])
+        response = item.get("response") or {}
+        if item.get("error") or response.get("status_code") != 200:
+            failures[index] = item.get("error") or response.get("body")
+            continue
+        
+        body = response["body"]
+        usage = body["usage"]
+        results[index] = CompletionResponse(
+            text=body["choices"][0]["message"]["content"],
+            model=body["model"],
+            created_at=datetime.fromtimestamp(body["created"]),
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            total_tokens=usage["total_tokens"]
+        )
+    
+    if failures:
+        details = "; ".join(f"request-{index}: {failures[index]}" for index in sorted(failures)[:5])
+        raise ValueError(f"OpenAI 批量任务中有 {len(failures)} 条请求失败: {details}")
+    if sorted(results) != list(range(total)):
+        raise ValueError(f"OpenAI 批量任务结果不完整: 提交 {total} 条请求，返回 {len(results)} 条结果")
+    return [results[index] for index in range(total)]
+
+# 语义缓存使用的向量模型
+_EMBEDDING_MODEL = "text-embedding-3-small"
+
+# 语义缓存按 (模型, 生成参数) 分别创建，在所有会话间共用；超过上限时淘汰最久未使用的缓存
+_SEMANTIC_CACHE_SCOPES = 32
+_semantic_caches: "OrderedDict[tuple, SemanticCache]" = OrderedDict()
+_semantic_caches_lock = threading.Lock()
+
+def _semantic_cache_for(model: str, params: Dict) -> SemanticCache:
+    """获取模型和生成参数对应的语义缓存
+    
+    只有模型和全部生成参数（temperature、max_tokens 等）都相同的请求才共用缓存，
+    generate_text 只发送单条用户消息，提示之外没有其他上下文
+    """
+    scope = (model, repr(sorted(params.items())))
+    with _semantic_caches_lock:
+        cache = _semantic_caches.get(scope)
+        if cache is None:
+            cache = _semantic_caches[scope] = SemanticCache()
+            if len(_semantic_caches) > _SEMANTIC_CACHE_SCOPES:
+                _semantic_caches.popitem(last=False)
+        else:
+            _semantic_caches.move_to_end(scope)
+        return cache
+
+# 支持在一次请求中提交多个提示的 Completions 接口模型
+_COMPLETIONS_MODELS = frozenset({"gpt-3.5-turbo-instruct", "davinci-002", "babbage-002"})
+
+# 仅在速率限制时重试，使用全抖动指数退避，避免并发请求同时重试
+_retry_on_rate_limit = retry(
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=1, max=30),
+    retry=retry_if_exception_type(RateLimitError),
+    reraise=True
+)
+
+# 支持的模型及定价（每1k tokens），各服务实例共用
+_MODELS = MappingProxyType({
+    "gpt-4": ModelInfo(
+        name="gpt-4",
+        max_tokens=8192,
+        pricing={"input": 0.03, "output": 0.06}
+    ),
+    "gpt-4-turbo-preview": ModelInfo(
+        name="gpt-4-turbo-preview",
+        max_tokens=128000,
+        pricing={"input": 0.01, "output": 0.03}
+    ),
+    "gpt-3.5-turbo": ModelInfo(
+        name="gpt-3.5-turbo",
+        max_tokens=4096,
+        pricing={"input": 0.0005, "output": 0.0015}
+    )
+})
 
 @LLMServiceFactory.register("openai")
 class OpenAIService(LLMService):
@@ -16,28 +170,20 @@ class OpenAIService(LLMService):
                 "OpenAI API密钥未设置。请在.env文件中设置OPENAI_API_KEY环境变量。"
             )
             
+        # 连接池绑定当前事件循环，服务实例由工厂按事件循环创建，运行结束时由 aclose 关闭
         self.client = AsyncOpenAI(
             api_key=api_key,
-            organization=os.getenv("OPENAI_ORG_ID")
+            organization=os.getenv("OPENAI_ORG_ID"),
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+                timeout=httpx.Timeout(600.0, connect=10.0)
+            )
         )
         
-        self.models = {
-            "gpt-4": ModelInfo(
-                name="gpt-4",
-                max_tokens=8192,
-                pricing={"input": 0.03, "output": 0.06}
-            ),
-            "gpt-4-turbo-preview": ModelInfo(
-                name="gpt-4-turbo-preview",
-                max_tokens=128000,
-                pricing={"input": 0.01, "output": 0.03}
-            ),
-            "gpt-3.5-turbo": ModelInfo(
-                name="gpt-3.5-turbo",
-                max_tokens=4096,
-                pricing={"input": 0.0005, "output": 0.0015}
-            )
-        }
+        # 语义缓存会跳过实际请求，影响性能测试结果，默认关闭
+        self.semantic_cache_enabled = get_settings().semantic_cache_enabled
+        
+        self.models = _MODELS
     
     async def get_available_models(self) -> List[str]:
         """获取可用模型列表"""
@@ -51,6 +197,16 @@ class OpenAIService(LLMService):
             raise ValueError(f"未知的模型: {model_name}")
         return self.models[model_name]
     
+    async def _embed(self, text: str) -> List[float]:
+        """计算文本的向量表示"""
+        async with self._request_slot():
+            response = await self.client.embeddings.create(
+                model=_EMBEDDING_MODEL,
+                input=text
+            )
+        return response.data[0].embedding
+    
+    @_retry_on_rate_limit
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -62,11 +218,12 @@ class OpenAIService(LLMService):
             if not model:
                 model = "gpt-3.5-turbo"
                 
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                **kwargs
-            )
+            async with self._request_slot():
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    **kwargs
+                )
             
             return {
                 "content": response.choices[0].message.content,
@@ -74,9 +231,12 @@ class OpenAIService(LLMService):
                 "completion_tokens": response.usage.completion_tokens,
                 "total_tokens": response.usage.total_tokens
             }
+        except openai.RateLimitError as e:
+            raise RateLimitError(f"OpenAI API速率限制: {str(e)}")
         except Exception as e:
             raise ValueError(f"OpenAI API调用失败: {str(e)}")
         
+    @_retry_on_rate_limit
     async def generate_text(
         self,
         prompt: str,
@@ -86,16 +246,33 @@ class OpenAIService(LLMService):
     ) -> CompletionResponse:
         """生成文本"""
         try:
-            model = kwargs.get('model', 'gpt-3.5-turbo')
-            response = await self.client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                **kwargs
-            )
+            model = kwargs.pop('model', 'gpt-3.5-turbo')
+            
+            # 未指定 max_tokens 时不传该参数，由接口按模型上限处理
+            if max_tokens is not None:
+                kwargs['max_tokens'] = max_tokens
             
-            return CompletionResponse(
+            cache = None
+            if self.semantic_cache_enabled:
+                cache = _semantic_cache_for(model, {"temperature": temperature, **kwargs})
+                cached = await cache.lookup(prompt, self._embed)
+                if cached is not None:
+                    # 命中缓存时没有消耗输入token
+                    return replace(
+                        cached,
+                        prompt_tokens=0,
+                        total_tokens=cached.completion_tokens
+                    )
+            
+            async with self._request_slot():
+                response = await self.client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    **kwargs
+                )
+            
+            result = CompletionResponse(
                 text=response.choices[0].message.content,
                 model=model,
                 created_at=datetime.now(),
@@ -103,18 +280,228 @@ class OpenAIService(LLMService):
                 completion_tokens=response.usage.completion_tokens,
                 total_tokens=response.usage.total_tokens
             )
+            if cache is not None:
+                await cache.put(prompt, result, self._embed)
+            return result
+        except openai.RateLimitError as e:
+            raise RateLimitError(f"OpenAI API速率限制: {str(e)}")
         except Exception as e:
             raise ValueError(f"OpenAI API调用失败: {str(e)}")
     
+    async def generate_text_batch(
+        self,
+        prompts: List[str],
+        model: str = None,
+        max_tokens: Optional[int] = None,
+        temperature: float = 0.7,
+        concurrency: int = 8,
+        **kwargs
+    ) -> List[CompletionResponse]:
+        """批量生成文本
+        
+        Completions 接口的模型将提示按估算token数分组，每组合并为一次请求；聊天模型不支持多提示，
+        按 concurrency 限制并发逐条请求。
+        
+        Args:
+            prompts: 提示列表
+            model: 模型名称
+            max_tokens: 最大生成token数
+            temperature: 温度
+            concurrency: 聊天模型的最大并发请求数
+            
+        Returns:
+            List[CompletionResponse]: 与 prompts 顺序一致的响应结果
+        """
+        if not model:
+            model = "gpt-3.5-turbo"
+        if not prompts:
+            return []
+        
+        if model in _COMPLETIONS_MODELS:
+            # 按估算的token数将提示分组，每组一次请求
+            groups = await asyncio.gather(*(
+                self._complete_prompts(batch, model, max_tokens, temperature, **kwargs)
+                for batch in _pack_prompts(prompts)
+            ))
+            return [result for group in groups for result in group]
+        
+        sem = asyncio.Semaphore(concurrency)
+        
+        async def one(prompt: str) -> CompletionResponse:
+            async with sem:
+                return await self.generate_text(
+                    prompt,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    model=model,
+                    **kwargs
+                )
+        
+        return await asyncio.gather(*(one(prompt) for prompt in prompts))
+    
+    async def submit_batch(
+        self,
+        prompts: List[str],
+        model: str = None,
+        **kwargs
+    ) -> str:
+        """通过 Batch API 提交批量聊天补全任务
+        
+        批量任务在24小时内异步完成，费用约为实时接口的一半，适合不需要即时结果的批量测试。
+        
+        Args:
+            prompts: 提示列表
+            model: 模型名称
+            **kwargs: 其他补全参数，应用于每条请求
+            
+        Returns:
+            str: 批量任务ID，用于 wait_batch 获取结果
+        """
+        import orjson
+        
+        if not model:
+            model = "gpt-3.5-turbo"
+        if not prompts:
+            raise ValueError("批量任务至少需要一条提示")
+        
+        lines = [
+            orjson.dumps({
+                "custom_id": f"request-{index}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": [{"role": "user", "content": prompt}],
+                    **kwargs
+                }
+            })
+            for index, prompt in enumerate(prompts)
+        ]
+        
+        try:
+            async with self._request_slot():
+                batch_file = await self.client.files.create(
+                    file=("batch.jsonl", b"\n".join(lines)),
+                    purpose="batch"
+                )
+                batch = await self.client.batches.create(
+                    input_file_id=batch_file.id,
+                    endpoint="/v1/chat/completions",
+                    completion_window="24h"
+                )
+        except Exception as e:
+            raise ValueError(f"OpenAI 批量任务提交失败: {str(e)}")
+        return batch.id
+    
+    async def wait_batch(
+        self,
+        batch_id: str,
+        poll_interval: float = 5.0,
+        max_poll_interval: float = 60.0,
+        timeout: Optional[float] = None
+    ) -> List[CompletionResponse]:
+        """等待批量任务完成并获取结果
+        
+        轮询间隔按指数增长并加入随机抖动，避免多个任务同时轮询。
+        
+        Args:
+            batch_id: submit_batch 返回的任务ID
+            poll_interval: 初始轮询间隔（秒）
+            max_poll_interval: 最大轮询间隔（秒）
+            timeout: 最长等待时间（秒），默认一直等待
+            
+        Returns:
+            List[CompletionResponse]: 与提交时提示顺序一致的响应结果
+            
+        Raises:
+            ValueError: 任务失败，或任务中有请求失败
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        delay = poll_interval
+        
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status == "completed":
+                break
+            if batch.status in _BATCH_FAILED_STATUSES:
+                raise ValueError(f"OpenAI 批量任务 {batch_id} 未完成: {batch.status}")
+            if deadline is not None and loop.time() >= deadline:
+                raise TimeoutError(f"等待 OpenAI 批量任务 {batch_id} 超时")
+            
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, max_poll_interval)
+        
+        # 执行失败的请求写入错误文件，不在输出文件中
+        output, errors = await asyncio.gather(
+            self._file_content(batch.output_file_id),
+            self._file_content(batch.error_file_id)
+        )
+        return _parse_batch_results(output, errors, batch.request_counts.total)
+    
+    async def _file_content(self, file_id: Optional[str]) -> bytes:
+        """下载文件内容，没有文件时返回空内容"""
+        if not file_id:
+            return b""
+        response = await self.client.files.content(file_id)
+        return response.content
+    
+    async def _complete_prompts(
+        self,
+        prompts: List[str],
+        model: str,
+        max_tokens: Optional[int],
+        temperature: float,
+        **kwargs
+    ) -> List[CompletionResponse]:
+        """通过 Completions 接口在一次请求中生成多个提示的结果"""
+        try:
+            async with self._request_slot():
+                response = await self.client.completions.create(
+                    model=model,
+                    prompt=prompts,
+                    max_tokens=_COMPLETION_DEFAULT_MAX_TOKENS if max_tokens is None else max_tokens,
+                    temperature=temperature,
+                    **kwargs
+                )
+        except Exception as e:
+            raise ValueError(f"OpenAI API调用失败: {str(e)}")
+        
+        # 用量只有整个请求的汇总值，按条使用 tiktoken 计算
+        created_at = datetime.now()
+        results = []
+        for choice in sorted(response.choices, key=lambda c: c.index):
+            prompt_tokens = count_text_tokens(prompts[choice.index])
+            completion_tokens = count_text_tokens(choice.text)
+            results.append(CompletionResponse(
+                text=choice.text,
+                model=model,
+                created_at=created_at,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            ))
+        return results
+    
     async def count_tokens(self, text: str) -> int:
         """计算文本的token数量"""
-        # 使用简单的估算方法
-        return len(text.split()) * 1.3
+        return count_text_tokens(text)
+    
+    async def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """批量计算多段文本的token数量，一次调用完成全部编码"""
+        return [len(tokens) for tokens in get_encoding().encode_batch(texts)]
+    
+    def _validation_key(self) -> tuple:
+        """连接验证结果按API密钥和组织区分"""
+        return (type(self).__name__, self.client.api_key, self.client.organization)
     
     async def validate_connection(self) -> bool:
-        """验证API连接是否正常"""
+        """验证API连接是否正常，验证成功后 VALIDATION_TTL 秒内直接返回"""
+        if self._recently_validated():
+            return True
         try:
             await self.client.models.list()
-            return True
         except Exception:
-            return False 
\ No newline at end of file
+            return False
+        self._mark_validated()
+        return True 
\ No newline at end of file
@@ -0,0 +1,25 @@
+"""
+tiktoken 编码器与 token 计数
+"""
+
+from functools import lru_cache
+import tiktoken
+
+# 不超过该长度的文本会缓存计数结果
+_CACHE_MAX_CHARS = 2048
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str = "cl100k_base"):
+    """获取 tiktoken 编码器，同一编码在进程内只加载一次"""
+    return tiktoken.get_encoding(name)
+
+@lru_cache(maxsize=1024)
+def _count_short_text(text: str) -> int:
+    """计算短文本的token数量（带缓存）"""
+    return len(get_encoding().encode(text))
+
+def count_text_tokens(text: str) -> int:
+    """使用 cl100k_base 编码计算文本的token数量"""
+    if len(text) <= _CACHE_MAX_CHARS:
+        return _count_short_text(text)
+    return len(get_encoding().encode(text))
@@ -1,46 +1,92 @@
 import os
+import warnings
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from typing import Optional
-from pydantic import BaseSettings, Field
+from dotenv import dotenv_values
 
-class Settings(BaseSettings):
+@dataclass(frozen=True, slots=True)
+class Settings:
     """应用配置类"""
     # OpenAI配置
-    openai_api_key: str = Field(..., env='OPENAI_API_KEY')
-    openai_org_id: Optional[str] = Field(None, env='OPENAI_ORG_ID')
+    openai_api_key: Optional[str] = None
+    openai_org_id: Optional[str] = None
     
     # Azure OpenAI配置
-    azure_openai_api_key: str = Field(..., env='AZURE_OPENAI_API_KEY')
-    azure_openai_endpoint: str = Field(..., env='AZURE_OPENAI_ENDPOINT')
-    azure_openai_api_version: str = Field("2024-02-15-preview", env='AZURE_OPENAI_API_VERSION')
-    azure_deployment_name: str = Field("gpt-4", env='AZURE_DEPLOYMENT_NAME')
+    azure_openai_api_key: Optional[str] = None
+    azure_openai_endpoint: Optional[str] = None
+    azure_openai_api_version: str = "2024-02-15-preview"
+    azure_deployment_name: str = "gpt-4"
     
     # Anthropic配置
-    anthropic_api_key: str = Field(..., env='ANTHROPIC_API_KEY')
+    anthropic_api_key: Optional[str] = None
     
     # Google配置
-    google_api_key: str = Field(..., env='GOOGLE_API_KEY')
+    google_api_key: Optional[str] = None
     
     # Hugging Face配置
-    huggingface_api_key: str = Field(..., env='HUGGINGFACE_API_KEY')
+    huggingface_api_key: Optional[str] = None
     
     # 应用配置
-    app_name: str = Field('LLM测试工具', env='APP_NAME')
-    debug_mode: bool = Field(False, env='DEBUG_MODE')
-    log_level: str = Field('INFO', env='LOG_LEVEL')
+    app_name: str = 'LLM测试工具'
+    debug_mode: bool = False
+    log_level: str = 'INFO'
     
     # 数据存储配置
-    data_dir: str = Field('./data', env='DATA_DIR')
-    cache_dir: str = Field('./cache', env='CACHE_DIR')
+    data_dir: str = './data'
+    cache_dir: str = './cache'
     
-    class Config:
-        env_file = '.env'
-        env_file_encoding = 'utf-8'
+    # 请求配置
+    max_concurrent_requests: int = 20
+    semantic_cache_enabled: bool = False
+    
+    @classmethod
+    def from_env(cls, env_file: Optional[str] = '.env') -> "Settings":
+        """从环境变量创建配置，.env 文件中的值优先级低于已设置的环境变量
+        
+        Args:
+            env_file: .env 文件路径，为空或文件不存在时只读取环境变量
+        """
+        env = dict(os.environ)
+        if env_file and os.path.exists(env_file):
+            env = {**dotenv_values(env_file, encoding='utf-8'), **env}
+        
+        # 环境变量名为字段名的大写形式，未设置或为空时使用默认值
+        values = {}
+        for field in fields(cls):
+            name = field.name.upper()
+            value = env.get(name)
+            if not value:
+                continue
+            if field.type is bool:
+                value = value.strip().lower() in ('1', 'true', 'yes', 'on')
+            elif field.type is int:
+                try:
+                    value = int(value)
+                except ValueError:
+                    # 配置错误不应导致所有页面无法使用，使用默认值并给出提示
+                    warnings.warn(f"配置项 {name} 的值 {value!r} 不是整数，使用默认值 {field.default}")
+                    continue
+            values[field.name] = value
+        return cls(**values)
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """获取全局配置实例，首次调用时才读取环境变量
+    
+    API密钥均为可选项，由使用它的服务在初始化时检查
+    """
+    return Settings.from_env()
 
-# 创建全局配置实例
-settings = Settings()
+def __getattr__(name):
+    # 兼容旧的 `from utils.config import settings` 用法，首次访问时才创建配置
+    if name == 'settings':
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def ensure_directories():
     """确保必要的目录存在"""
+    settings = get_settings()
     directories = [
         settings.data_dir,
         settings.cache_dir,
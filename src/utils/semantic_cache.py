@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+import numpy as np
+
+# 计算文本向量的协程函数
+Embed = Callable[[str], Awaitable[Sequence[float]]]
+
+class SemanticCache:
+    """基于向量相似度的提示/响应缓存
+
+    以提示的向量表示为键缓存响应，新提示与已缓存提示的余弦相似度达到阈值即视为命中。
+    完全相同的提示直接命中，不计算向量。条目数超过上限时淘汰最久未使用的条目。
+
+    向量由调用方传入的 embed 计算，缓存本身不持有客户端，可在多个事件循环和线程间共用；
+    读写缓存数据时加锁，计算向量时不持有锁。
+    """
+
+    def __init__(self, max_size: int = 256, threshold: float = 0.9):
+        """初始化缓存
+
+        Args:
+            max_size: 最大缓存条目数
+            threshold: 默认命中阈值（余弦相似度）
+        """
+        self.max_size = max_size
+        self.threshold = threshold
+        self._lock = threading.Lock()
+
+        # 已缓存的条目占用 0..len(self._slots)-1 号槽位，向量按槽位存放在同一矩阵中
+        self._vectors: Optional[np.ndarray] = None
+        self._slots: "OrderedDict[str, int]" = OrderedDict()  # 提示 -> 槽位，按最近使用排序
+        self._prompts: List[Optional[str]] = [None] * max_size
+        self._responses: List[Any] = [None] * max_size
+
+        # lookup 未命中时计算的向量，供随后的 put 复用
+        self._pending: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @staticmethod
+    async def _vector(prompt: str, embed: Embed) -> np.ndarray:
+        """计算提示的单位向量"""
+        vector = np.asarray(await embed(prompt), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def lookup(self, prompt: str, embed: Embed, threshold: Optional[float] = None) -> Optional[Any]:
+        """查找与提示相同或语义相近的已缓存响应
+
+        Args:
+            prompt: 提示
+            embed: 计算文本向量的协程函数
+            threshold: 命中阈值，默认使用初始化时的阈值
+
+        Returns:
+            Optional[Any]: 命中时返回缓存的响应，否则返回 None
+        """
+        with self._lock:
+            slot = self._slots.get(prompt)
+            if slot is not None:
+                self._slots.move_to_end(prompt)
+                return self._responses[slot]
+
+        vector = await self._vector(prompt, embed)
+
+        with self._lock:
+            if len(self._pending) >= self.max_size:
+                self._pending.clear()
+            self._pending[prompt] = vector
+
+            count = len(self._slots)
+            if not count:
+                return None
+
+            similarities = self._vectors[:count] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < (self.threshold if threshold is None else threshold):
+                return None
+
+            self._slots.move_to_end(self._prompts[best])
+            return self._responses[best]
+
+    async def put(self, prompt: str, response: Any, embed: Embed):
+        """缓存提示对应的响应
+
+        Args:
+            prompt: 提示
+            response: 响应
+            embed: 计算文本向量的协程函数，lookup 已计算过向量时不再调用
+        """
+        with self._lock:
+            vector = self._pending.pop(prompt, None)
+        if vector is None:
+            vector = await self._vector(prompt, embed)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+
+            if prompt in self._slots:
+                slot = self._slots[prompt]
+                self._slots.move_to_end(prompt)
+            elif len(self._slots) < self.max_size:
+                slot = len(self._slots)
+                self._slots[prompt] = slot
+            else:
+                # 淘汰最久未使用的条目，复用其槽位
+                _, slot = self._slots.popitem(last=False)
+                self._slots[prompt] = slot
+
+            self._vectors[slot] = vector
+            self._prompts[slot] = prompt
+            self._responses[slot] = response
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._slots.clear()
+            self._pending.clear()
+            self._prompts = [None] * self.max_size
+            self._responses = [None] * self.max_size
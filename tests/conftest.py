@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 应用以 src 为根目录导入模块（services、utils 等），测试时同样加入导入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,99 @@
+import os
+from pages.config.config_page import _parse_env
+from services.azure_openai_service import _parse_azure_configs
+
+def _write_env(tmp_path, content):
+    path = tmp_path / ".env"
+    path.write_text(content, encoding="utf-8")
+    return str(path), os.path.getmtime(path)
+
+def test_parse_env_groups_and_sections(tmp_path):
+    """测试按配置组和分类解析配置项"""
+    path, mtime = _write_env(tmp_path, (
+        "TOP=ignored\n"
+        "## 组A\n"
+        "# 分类1\n"
+        "KEY1=v1\n"
+        "  KEY2 = a=b  \r\n"
+        "#注释\n"
+        "\n"
+        "## 组B\n"
+        "KEY3=\n"
+        "# 分类2\n"
+        "URL=http://x/#frag\n"
+    ))
+    config = _parse_env(path, mtime)
+
+    # 配置组之前的配置项被忽略
+    assert list(config) == ["组A_KEY1", "组A_KEY2", "组B_KEY3", "组B_URL"]
+    assert config["组A_KEY1"] == {
+        "value": "v1",
+        "section": "分类1",
+        "group": "组A",
+        "original_key": "KEY1"
+    }
+    # 去除键和值两侧的空白，值中的等号保留
+    assert config["组A_KEY2"]["original_key"] == "KEY2"
+    assert config["组A_KEY2"]["value"] == "a=b"
+    # 空值保留，分类沿用上一个分类标记
+    assert config["组B_KEY3"]["value"] == ""
+    assert config["组B_KEY3"]["section"] == "分类1"
+    assert config["组B_URL"] == {
+        "value": "http://x/#frag",
+        "section": "分类2",
+        "group": "组B",
+        "original_key": "URL"
+    }
+
+def test_parse_env_empty_file(tmp_path):
+    """测试空文件"""
+    path, mtime = _write_env(tmp_path, "")
+    assert _parse_env(path, mtime) == {}
+
+def test_parse_azure_configs(tmp_path):
+    """测试解析完整的 Azure OpenAI 配置组"""
+    path, mtime = _write_env(tmp_path, (
+        "## east\n"
+        "AZURE_OPENAI_API_KEY=k1\n"
+        "AZURE_OPENAI_ENDPOINT=https://east\n"
+        "AZURE_DEPLOYMENT_NAME=gpt-4\n"
+        "## west\n"
+        "AZURE_OPENAI_API_KEY=your_azure_openai_api_key\n"
+        "AZURE_OPENAI_ENDPOINT=https://west\n"
+        "AZURE_DEPLOYMENT_NAME=gpt-35\n"
+        "## south\n"
+        "AZURE_OPENAI_API_KEY=k2\n"
+        "AZURE_DEPLOYMENT_NAME=gpt-35\n"
+        "## north\n"
+        "AZURE_OPENAI_API_KEY = k3\n"
+        "AZURE_OPENAI_ENDPOINT=https://north\n"
+        "AZURE_DEPLOYMENT_NAME=gpt-35-turbo\n"
+        "AZURE_OPENAI_API_VERSION=2024-06-01\n"
+        "OTHER=1\n"
+    ))
+    configs = _parse_azure_configs(path, mtime)
+
+    # 占位值视为未配置（west），缺少必需配置项的配置组被忽略（south）
+    assert configs == {
+        "east": {
+            "api_key": "k1",
+            "endpoint": "https://east",
+            "deployment_name": "gpt-4",
+            "api_version": "2024-02-15-preview"
+        },
+        "north": {
+            "api_key": "k3",
+            "endpoint": "https://north",
+            "deployment_name": "gpt-35-turbo",
+            "api_version": "2024-06-01"
+        }
+    }
+
+def test_parse_azure_configs_ignores_keys_outside_groups(tmp_path):
+    """测试配置组之前的配置项被忽略"""
+    path, mtime = _write_env(tmp_path, (
+        "AZURE_OPENAI_API_KEY=k1\n"
+        "AZURE_OPENAI_ENDPOINT=https://east\n"
+        "AZURE_DEPLOYMENT_NAME=gpt-4\n"
+    ))
+    assert _parse_azure_configs(path, mtime) == {}
@@ -0,0 +1,87 @@
+import math
+import orjson
+import pytest
+from services.openai_service import _pack_prompts, _parse_batch_results
+
+def _estimated_tokens(batch):
+    return math.ceil(sum(len(prompt.encode("utf-8")) for prompt in batch) * 0.25)
+
+def _result_line(index, content="ok", status_code=200):
+    """构造批量任务输出文件中的一行"""
+    return orjson.dumps({
+        "custom_id": f"request-{index}",
+        "response": {
+            "status_code": status_code,
+            "body": {
+                "model": "gpt-3.5-turbo",
+                "created": 1700000000,
+                "choices": [{"message": {"content": content}}],
+                "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+            }
+        },
+        "error": None
+    })
+
+def _error_line(index, message="boom"):
+    """构造批量任务错误文件中的一行"""
+    return orjson.dumps({
+        "custom_id": f"request-{index}",
+        "response": None,
+        "error": {"code": "server_error", "message": message}
+    })
+
+def test_pack_prompts_fills_groups_up_to_limit():
+    """测试恰好达到上限的提示分在同一组"""
+    # 每个提示20字节（5 tokens），上限10 tokens时每组恰好两个
+    prompts = [c * 20 for c in "abcde"]
+    assert _pack_prompts(prompts, limit=10) == [prompts[0:2], prompts[2:4], prompts[4:5]]
+
+def test_pack_prompts_preserves_order_and_limit():
+    """测试分组后顺序不变且每组不超过上限"""
+    prompts = [f"prompt {i} " + "x" * (i * 37 % 400) for i in range(200)]
+    batches = _pack_prompts(prompts, limit=1000)
+    assert [prompt for batch in batches for prompt in batch] == prompts
+    assert all(_estimated_tokens(batch) <= 1000 for batch in batches)
+    # 贪心分组：下一组的第一个提示放不进上一组
+    for previous, current in zip(batches, batches[1:]):
+        assert _estimated_tokens(previous + current[:1]) > 1000
+
+def test_pack_prompts_oversized_prompt_alone():
+    """测试超过上限的单个提示单独成组"""
+    prompts = ["b" * 4, "a" * 100, "c" * 4]
+    assert _pack_prompts(prompts, limit=10) == [["b" * 4], ["a" * 100], ["c" * 4]]
+
+def test_pack_prompts_counts_utf8_bytes():
+    """测试按UTF-8字节数而不是字符数估算"""
+    # 每个提示21字节，两个合计42字节（11 tokens）超过上限
+    prompts = ["汉" * 7, "汉" * 7]
+    assert _pack_prompts(prompts, limit=10) == [[prompts[0]], [prompts[1]]]
+
+def test_pack_prompts_empty():
+    """测试空输入"""
+    assert _pack_prompts([]) == []
+
+def test_parse_batch_results_orders_by_custom_id():
+    """测试结果按 custom_id 序号排列"""
+    output = b"\n".join([_result_line(2, "c"), _result_line(0, "a"), b"", _result_line(1, "b")])
+    results = _parse_batch_results(output, b"", 3)
+    assert [result.text for result in results] == ["a", "b", "c"]
+    assert results[0].total_tokens == 5
+
+def test_parse_batch_results_reports_error_file():
+    """测试错误文件中的失败请求"""
+    output = b"\n".join([_result_line(0), _result_line(2)])
+    with pytest.raises(ValueError, match="request-1"):
+        _parse_batch_results(output, _error_line(1), 3)
+
+def test_parse_batch_results_reports_failed_status():
+    """测试输出文件中状态码不为200的请求"""
+    output = b"\n".join([_result_line(0), _result_line(1, status_code=500)])
+    with pytest.raises(ValueError, match="request-1"):
+        _parse_batch_results(output, b"", 2)
+
+def test_parse_batch_results_rejects_missing_results():
+    """测试结果数与提交的请求数不一致"""
+    output = b"\n".join([_result_line(0), _result_line(1)])
+    with pytest.raises(ValueError, match="不完整"):
+        _parse_batch_results(output, b"", 3)
@@ -0,0 +1,59 @@
+import math
+import statistics
+import pandas as pd
+import pytest
+from components.performance_stats import _update_perf_stats
+from pages.stats.stats_page import _pooled_mean_std
+
+def test_update_perf_stats_matches_batch_statistics():
+    """测试 Welford 增量统计与一次性计算的结果一致"""
+    response_times = [1.0, 2.5, 0.7, 3.1, 9.0, 1.2]
+    perf_stats = {}
+    for rt in response_times:
+        _update_perf_stats(perf_stats, "openai", "gpt-4", rt, 10, 5, 0.01)
+
+    stats = perf_stats[("openai", "gpt-4")]
+    assert stats["count"] == len(response_times)
+    assert stats["mean_rt"] == pytest.approx(statistics.mean(response_times))
+    assert math.sqrt(stats["m2_rt"] / (stats["count"] - 1)) == pytest.approx(statistics.stdev(response_times))
+    assert stats["min_rt"] == min(response_times)
+    assert stats["max_rt"] == max(response_times)
+    assert stats["sum_prompt"] == 10 * len(response_times)
+    assert stats["sum_completion"] == 5 * len(response_times)
+    assert stats["sum_cost"] == pytest.approx(0.01 * len(response_times))
+
+def test_update_perf_stats_groups_by_provider_and_model():
+    """测试按 (服务提供商, 模型) 分组统计"""
+    perf_stats = {}
+    _update_perf_stats(perf_stats, "openai", "gpt-4", 1.0, 10, 5, 0.01)
+    _update_perf_stats(perf_stats, "anthropic", "claude-3-haiku", 2.0, 3, 4, 0.02)
+    _update_perf_stats(perf_stats, "openai", "gpt-4", 3.0, 10, 5, 0.01)
+
+    assert set(perf_stats) == {("openai", "gpt-4"), ("anthropic", "claude-3-haiku")}
+    assert perf_stats[("openai", "gpt-4")]["count"] == 2
+    assert perf_stats[("openai", "gpt-4")]["mean_rt"] == pytest.approx(2.0)
+    assert perf_stats[("anthropic", "claude-3-haiku")]["m2_rt"] == 0.0
+
+def test_pooled_mean_std_matches_ungrouped():
+    """测试由分组统计量合并的均值和标准差与不分组计算的结果一致"""
+    groups = {
+        "a": [1.0, 2.5, 0.7, 3.1],
+        "b": [9.0, 1.2],
+        "c": [4.4]  # 单条记录的分组标准差为空
+    }
+    df = pd.DataFrame(
+        [(name, value) for name, values in groups.items() for value in values],
+        columns=["group", "value"]
+    )
+    summary = df.groupby("group")["value"].agg(["size", "mean", "std"])
+
+    mean, std = _pooled_mean_std(summary["size"], summary["mean"], summary["std"])
+    values = df["value"].tolist()
+    assert mean == pytest.approx(statistics.mean(values))
+    assert std == pytest.approx(statistics.stdev(values))
+
+def test_pooled_mean_std_single_record():
+    """测试只有一条记录时标准差为空"""
+    mean, std = _pooled_mean_std(pd.Series([1]), pd.Series([2.0]), pd.Series([float("nan")]))
+    assert mean == pytest.approx(2.0)
+    assert math.isnan(std)
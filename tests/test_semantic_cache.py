@@ -0,0 +1,79 @@
+import pytest
+from utils.semantic_cache import SemanticCache
+
+class FakeEmbed:
+    """按预设向量返回结果并记录调用次数的向量函数"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.calls = []
+
+    async def __call__(self, text):
+        self.calls.append(text)
+        return self.vectors[text]
+
+@pytest.mark.asyncio
+async def test_lookup_miss_then_put_embeds_once():
+    """测试未命中后写入时复用已计算的向量"""
+    embed = FakeEmbed({"hello": [1.0, 0.0]})
+    cache = SemanticCache()
+    assert await cache.lookup("hello", embed) is None
+    await cache.put("hello", "R1", embed)
+    assert embed.calls == ["hello"]
+
+@pytest.mark.asyncio
+async def test_exact_hit_skips_embedding():
+    """测试完全相同的提示直接命中，不计算向量"""
+    embed = FakeEmbed({"hello": [1.0, 0.0]})
+    cache = SemanticCache()
+    await cache.put("hello", "R1", embed)
+    assert await cache.lookup("hello", embed) == "R1"
+    assert embed.calls == ["hello"]
+
+@pytest.mark.asyncio
+async def test_similarity_threshold():
+    """测试按余弦相似度判断是否命中"""
+    embed = FakeEmbed({
+        "hello": [1.0, 0.0],
+        "hello!": [0.99, 0.1],   # 相似度约0.995
+        "other": [0.0, 1.0]      # 相似度为0
+    })
+    cache = SemanticCache(threshold=0.9)
+    await cache.put("hello", "R1", embed)
+    assert await cache.lookup("hello!", embed) == "R1"
+    assert await cache.lookup("other", embed) is None
+    assert await cache.lookup("hello!", embed, threshold=0.999) is None
+
+@pytest.mark.asyncio
+async def test_evicts_least_recently_used():
+    """测试超过上限时淘汰最久未使用的条目"""
+    embed = FakeEmbed({"a": [1.0, 0.0, 0.0], "b": [0.0, 1.0, 0.0], "c": [0.0, 0.0, 1.0]})
+    cache = SemanticCache(max_size=2)
+    await cache.put("a", "A", embed)
+    await cache.put("b", "B", embed)
+    assert await cache.lookup("a", embed) == "A"  # a 成为最近使用
+    await cache.put("c", "C", embed)
+    assert len(cache) == 2
+    assert await cache.lookup("b", embed) is None
+    assert await cache.lookup("a", embed) == "A"
+    assert await cache.lookup("c", embed) == "C"
+
+@pytest.mark.asyncio
+async def test_put_existing_prompt_replaces_response():
+    """测试重复写入同一提示时更新响应"""
+    embed = FakeEmbed({"a": [1.0, 0.0]})
+    cache = SemanticCache()
+    await cache.put("a", "old", embed)
+    await cache.put("a", "new", embed)
+    assert len(cache) == 1
+    assert await cache.lookup("a", embed) == "new"
+
+@pytest.mark.asyncio
+async def test_clear():
+    """测试清空缓存"""
+    embed = FakeEmbed({"a": [1.0, 0.0]})
+    cache = SemanticCache()
+    await cache.put("a", "A", embed)
+    cache.clear()
+    assert len(cache) == 0
+    assert await cache.lookup("a", embed) is None